@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, SubCategory, Item, ConsumptionRecord
+from .models import Category, SubCategory, Item, ConsumptionRecord, UserCredit, WeeklyScore
 
 # Register your models here.
 admin.site.register(Category)
@@ -13,6 +13,15 @@ class ItemAdmin(admin.ModelAdmin):
 
 @admin.register(ConsumptionRecord)
 class ConsumptionRecordAdmin(admin.ModelAdmin):
-    list_display = ('user', 'item', 'quantity', 'date', 'timestamp')
+    list_display = ('user', 'item', 'quantity', 'credits', 'date', 'timestamp')
     list_filter = ('user', 'date', 'item__category')
     date_hierarchy = 'date'
+
+@admin.register(UserCredit)
+class UserCreditAdmin(admin.ModelAdmin):
+    list_display = ('user', 'lifetime_credits')
+
+@admin.register(WeeklyScore)
+class WeeklyScoreAdmin(admin.ModelAdmin):
+    list_display = ('week_start', 'user', 'credits')
+    list_filter = ('week_start',)
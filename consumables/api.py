@@ -0,0 +1,241 @@
+"""
+JSON API for kiosks and handheld scanners.
+
+The same data as the pages, without model instances or templates: endpoints
+read values_list() columns (or the catalogue snapshot) and answer compact
+JSON. Lists come as {"fields": [...], "rows": [[...], ...], "next": cursor}
+so field names aren't repeated per row; ``?fields=a,b`` picks the columns,
+and only the joins they need are made. ``next`` is an opaque cursor for
+``?cursor=``, keyset paged like the pages' infinite scroll, with ``?limit=``
+up to MAX_PAGE_SIZE. Callers log in like the pages (session cookie, CSRF
+token on POST); anonymous calls get 401 instead of the login redirect.
+
+GET  api/catalogue/     category > subcategory > item tree (ETag, like home)
+GET  api/items/         item stock; ?category=, ?subcategory=, ?band=low|medium|ok
+GET  api/items/<id>/    one item's stock
+GET  api/today/         today's consumption, newest first
+POST api/take/          {"item": id, "quantity": q} or {"items": [{"item": id, "quantity": q}, ...]}
+GET  api/leaderboard/   lifetime ranking and the week's leader
+"""
+import json
+from functools import wraps
+from operator import itemgetter
+
+from django.core.exceptions import BadRequest
+from django.db import connection
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_POST
+
+from . import feeds, ledger, takes
+from .catalogue import get_catalogue
+from .conditional import versioned_page, catalogue_version
+from .models import Item, StockBand
+from .retry import retry_writes
+from .views import leaderboard_week, lifetime_credits, today_records
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# API field name -> column read for it
+TREE_FIELDS = ('id', 'name', 'score')
+ITEM_FIELDS = {
+    'id': 'id', 'name': 'name', 'current_stock': 'current_stock', 'stock_band': 'stock_band',
+    'average_stock': 'average_stock', 'score': 'score', 'usage_count': 'usage_count',
+    'category_id': 'category_id', 'subcategory_id': 'subcategory_id',
+}
+ITEM_DEFAULT = ('id', 'name', 'current_stock', 'stock_band')
+RECORD_FIELDS = {
+    'id': 'id', 'time': 'timestamp', 'user_id': 'user_id', 'user': 'user__username', 'item_id': 'item_id',
+    'item': 'item__name', 'quantity': 'quantity', 'credits': 'credits',
+}
+LEADER_FIELDS = {
+    'rank': None, 'user_id': 'user_id', 'user': 'user__username', 'name': 'user__first_name',
+    'credits': 'lifetime_credits',
+}
+
+
+def respond(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def api_view(view):
+    """401 for anonymous callers, and errors as {"error": message} instead of HTML pages."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return respond({'error': "Authentication required"}, status=401)
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as e:
+            return respond({'error': str(e)}, status=400)
+        except Http404 as e:
+            return respond({'error': str(e)}, status=404)
+    return wrapper
+
+
+def selected(request, allowed, default):
+    """Field names from ``?fields=``, checked against ``allowed``."""
+    if not request.GET.get('fields'):
+        return tuple(default)
+    names = tuple(dict.fromkeys(name.strip() for name in request.GET['fields'].split(',') if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if unknown or not names:
+        raise BadRequest(f"Unknown fields {', '.join(unknown)}; choose from {', '.join(allowed)}")
+    return names
+
+
+def number(params, name, default=None):
+    try:
+        return int(params[name]) if params.get(name) else default
+    except ValueError:
+        raise BadRequest(f"{name} must be a whole number")
+
+
+def page_size(request):
+    return min(max(number(request.GET, 'limit', PAGE_SIZE), 1), MAX_PAGE_SIZE)
+
+
+def rows(names, values):
+    return {'fields': names, 'rows': [list(row) for row in values]}
+
+
+@api_view
+@require_GET
+@versioned_page(catalogue_version)
+def catalogue(request):
+    names = selected(request, TREE_FIELDS, TREE_FIELDS)
+    tree = get_catalogue()
+
+    def items(ids):
+        return [[getattr(tree.items[id], name) for name in names] for id in ids]
+
+    categories = []
+    for category in tree.categories.values():
+        categories.append({
+            'id': category.id,
+            'name': category.name,
+            # category.item_ids lists subcategory items too; these are the direct ones
+            'items': items(id for id in category.item_ids if tree.items[id].subcategory_id is None),
+            'subcategories': [
+                {'id': sub.id, 'name': sub.name, 'items': items(sub.item_ids)}
+                for sub in tree.subcategories_of(category.id)
+            ],
+        })
+    return respond({'fields': names, 'categories': categories})
+
+
+def item_filters(params):
+    filters = {}
+    if params.get('category'):
+        filters['category_id'] = number(params, 'category')
+    if params.get('subcategory'):
+        filters['subcategory_id'] = number(params, 'subcategory')
+    if params.get('band'):
+        bands = {band.label.lower(): band for band in StockBand}
+        if params['band'] not in bands:
+            raise BadRequest(f"band must be one of {', '.join(bands)}")
+        filters['stock_band'] = bands[params['band']]
+    return filters
+
+
+@api_view
+@require_GET
+def items(request):
+    names = selected(request, ITEM_FIELDS, ITEM_DEFAULT)
+    size = page_size(request)
+    # Keyset on the primary key: ?cursor= is the last id of the previous page
+    queryset = Item.objects.filter(**item_filters(request.GET), id__gt=number(request.GET, 'cursor', 0))
+    found = list(queryset.order_by('id').values_list('id', *(ITEM_FIELDS[name] for name in names))[:size + 1])
+    cursor = str(found[size - 1][0]) if len(found) > size else None
+    return respond({**rows(names, (row[1:] for row in found[:size])), 'next': cursor})
+
+
+@api_view
+@require_GET
+def item(request, item_id):
+    names = selected(request, ITEM_FIELDS, ITEM_FIELDS)
+    values = Item.objects.filter(pk=item_id).values_list(*(ITEM_FIELDS[name] for name in names)).first()
+    if values is None:
+        raise Http404("No Item matches the given query.")
+    return respond(dict(zip(names, values)))
+
+
+@api_view
+@require_GET
+def today(request):
+    names = selected(request, RECORD_FIELDS, RECORD_FIELDS)
+    # The feed key leads each row so feeds.page() can make the cursor
+    queryset = today_records().values_list('date', 'timestamp', 'id', *(RECORD_FIELDS[name] for name in names))
+    found, cursor = feeds.page(queryset, request.GET.get('cursor'), page_size(request), key=itemgetter(0, 1, 2))
+    records = [list(row[3:]) for row in found]
+    if 'time' in names:
+        column = names.index('time')
+        for record in records:
+            record[column] = timezone.localtime(record[column]).isoformat(timespec='seconds')
+    return respond({**rows(names, records), 'next': cursor})
+
+
+def parse_take(request):
+    """({item id: quantity}, single take?) from the JSON body; repeated ids are merged, as in take_cart."""
+    try:
+        data = json.loads(request.body)
+        lines = data['items'] if 'items' in data else [data]
+        cart = {}
+        for line in lines:
+            item_id, qty = int(line['item']), float(line['quantity'])
+            if qty <= 0:
+                raise ValueError("quantity must be positive")
+            cart[item_id] = cart.get(item_id, 0) + qty
+    except (ValueError, TypeError, KeyError) as e:
+        raise BadRequest(f"Expected {{\"item\": id, \"quantity\": n}} or {{\"items\": [...]}}: {e}")
+    if not cart:
+        raise BadRequest("Nothing to take")
+    return cart, 'items' not in data
+
+
+@api_view
+@require_POST
+@retry_writes
+def take(request):
+    cart, single = parse_take(request)
+    try:
+        if single:
+            (item_id, qty), = cart.items()
+            records = [takes.take_item(request.user, get_object_or_404(Item, pk=item_id), qty)]
+        else:
+            records = takes.take_cart(request.user, cart)
+    except takes.TakeRefused as e:
+        return respond({'error': str(e)}, status=409)
+    taken = [(r.id, r.item_id, r.quantity, r.credits) for r in records]
+    return respond(rows(('id', 'item_id', 'quantity', 'credits'), taken), status=201)
+
+
+@api_view
+@require_GET
+def leaderboard(request):
+    names = selected(request, LEADER_FIELDS, LEADER_FIELDS)
+    # Rank from the window function where there is one, else counted here as lifetime_leaderboard() does
+    ranked = connection.features.supports_over_clause
+    columns = [name for name in names if name != 'rank']
+    found = lifetime_credits().values_list(
+        'lifetime_credits', 'rank' if ranked else 'id', *(LEADER_FIELDS[name] for name in columns)
+    )
+    lifetime, last = [], None
+    for position, (score, rank, *values) in enumerate(found):
+        if not ranked:
+            rank = last[1] if last and last[0] == score else position + 1
+        last = (score, rank)
+        row = dict(zip(columns, values), rank=rank)
+        lifetime.append([row[name] for name in names])
+
+    start = leaderboard_week(timezone.localdate())
+    leader = ledger.weekly_leader(start)
+    return respond({
+        **rows(names, lifetime),
+        'week_start': start,
+        'weekly_leader': None if leader is None else {
+            'user_id': leader.user_id, 'user': leader.user.username, 'credits': leader.credits,
+        },
+    })
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ConsumablesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'consumables'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import auth, ledger, profiling, versioning  # noqa: F401 - auth, ledger and versioning connect their signal receivers
+        connection_created.connect(profiling.instrument_connection)
@@ -0,0 +1,81 @@
+"""
+Compaction of old consumption history.
+
+Records older than settings.CONSUMPTION_RETENTION_DAYS are summed into
+DailyConsumption (one row per date, user and item) and deleted, a batch per
+transaction, so ConsumptionRecord stays about the size of the retention window.
+Credits are already on the ledger and are not touched. Readers that total the
+whole history (profile_records, ledger.forget_item, ledger.rebuild) add the
+rollups to the raw rows and get the same figures as before compaction.
+"""
+import operator
+from datetime import timedelta
+from functools import reduce
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import ConsumptionRecord, DailyConsumption
+
+BATCH_SIZE = 500
+
+
+def cutoff(days=None):
+    """First date kept as raw records."""
+    days = settings.CONSUMPTION_RETENTION_DAYS if days is None else days
+    return timezone.localdate() - timedelta(days=days)
+
+
+def expired(before):
+    return ConsumptionRecord.objects.filter(date__lt=before)
+
+
+def compact(before, batch_size=BATCH_SIZE):
+    """Roll up and delete every record dated before ``before``; returns the number deleted."""
+    archived = 0
+    while (count := compact_batch(before, batch_size)):
+        archived += count
+    return archived
+
+
+@transaction.atomic
+def compact_batch(before, batch_size=BATCH_SIZE):
+    # Oldest first along consumption_feed_idx; each batch commits on its own so
+    # writers are only ever blocked for one batch
+    batch = expired(before).order_by('date', 'timestamp', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        # PostgreSQL: a second run at the same time (cron and a manual one) takes the
+        # next batch instead of rolling up records this one is about to delete.
+        # SQLite has one writer at a time, so the batch can't be compacted twice there
+        batch = batch.select_for_update(skip_locked=True)
+    ids = list(batch.values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return 0
+    totals = ConsumptionRecord.objects.filter(pk__in=ids).values('date', 'user_id', 'item_id').annotate(
+        total_quantity=Sum('quantity'), total_credits=Sum('credits'), total_records=Count('id'),
+    ).order_by()
+    rollups = {(row['date'], row['user_id'], row['item_id']): row for row in totals}
+
+    # Add to the days already rolled up by earlier batches or runs, in the database
+    # (quantity = quantity + ...) so concurrent runs can't overwrite each other's sums
+    DailyConsumption.objects.bulk_create(
+        [DailyConsumption(date=date, user_id=user_id, item_id=item_id) for date, user_id, item_id in rollups],
+        ignore_conflicts=True,
+    )
+
+    def add(field, total, output_field):
+        return F(field) + Case(*[
+            When(date=date, user_id=user_id, item_id=item_id, then=Value(row[total]))
+            for (date, user_id, item_id), row in rollups.items()
+        ], output_field=output_field)
+
+    keys = reduce(operator.or_, (Q(date=date, user_id=user_id, item_id=item_id) for date, user_id, item_id in rollups))
+    DailyConsumption.objects.filter(keys).update(
+        quantity=add('quantity', 'total_quantity', FloatField()),
+        credits=add('credits', 'total_credits', FloatField()),
+        records=add('records', 'total_records', IntegerField()),
+    )
+    ConsumptionRecord.objects.filter(pk__in=ids).delete()
+    return len(ids)
@@ -0,0 +1,161 @@
+"""
+Native async versions of the read-heavy pages, used when settings.ASYNC_VIEWS
+is on (asgi.py turns it on). They share querysets and helpers with the sync
+views in views.py and must render the same pages.
+
+Templates run synchronously and may not touch the database on the event loop,
+so context values are fully loaded before render(), and request.user is
+resolved up front because base.html and the auth context processor read it.
+Pages that skip loading data for cached fragments render off the loop
+instead (render_cached), in case a fragment is gone by the time it renders.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import aprefetch_related_objects
+from django.shortcuts import aget_object_or_404, render
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from . import feeds, ledger, versioning
+from .catalogue import aget_catalogue, astocked_items, get_catalogue, stocked_items
+from .conditional import versioned_page, inventory_version, catalogue_version, category_version, subcategory_version
+from .models import Category
+from .views import (
+    feed_next_url, leaderboard_week, lifetime_credits, lifetime_leaderboard, low_stock_items, profile_inventory,
+    profile_records, today_records,
+)
+
+
+def async_login_required(view):
+    """login_required that also leaves request.user resolved for the templates."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await request.auser()
+        return await view(request, *args, **kwargs)
+    return login_required(wrapper)
+
+
+async def render_cached(request, template, context, loaded):
+    """
+    render() for pages whose fragments were found in the cache and their data left
+    unloaded. A shared cache can drop a fragment between the lookup and render(),
+    and the template then loads the data itself with sync queries, which must run
+    off the event loop; with everything ``loaded`` the render stays on it.
+    """
+    if loaded:
+        return render(request, template, context)
+    return await sync_to_async(render)(request, template, context)
+
+
+@async_login_required
+@versioned_page(catalogue_version)
+async def home(request):
+    version = await versioning.acurrent(versioning.CATALOGUE)
+    loaded = not await cache.ahas_key(make_template_fragment_key('home_categories', [version]))
+    if loaded:
+        categories = [c async for c in Category.objects.all()]
+    else:
+        categories = SimpleLazyObject(lambda: list(Category.objects.all()))
+    return await render_cached(request, 'consumables/home.html', {
+        'categories': categories,
+        'catalogue_version': version
+    }, loaded)
+
+
+@async_login_required
+@versioned_page(category_version)
+async def view_category(request, category_id):
+    category = await aget_object_or_404(Category, pk=category_id)
+    loaded = not await cache.ahas_key(make_template_fragment_key('category_page', [category.id, category.version]))
+    if loaded:
+        catalogue = await aget_catalogue()
+        subcategories = catalogue.subcategories_of(category.id)
+        direct_items = await astocked_items(catalogue, category_id=category.id, subcategory__isnull=True)
+    else:
+        # Same lazy fallbacks as views.view_category, for a fragment dropped before render
+        catalogue = SimpleLazyObject(get_catalogue)
+        subcategories = SimpleLazyObject(lambda: catalogue.subcategories_of(category.id))
+        direct_items = SimpleLazyObject(
+            lambda: stocked_items(catalogue, category_id=category.id, subcategory__isnull=True)
+        )
+    return await render_cached(request, 'consumables/view_category.html', {
+        'category': category,
+        'subcategories': subcategories,
+        'direct_items': direct_items
+    }, loaded)
+
+
+@async_login_required
+@versioned_page(subcategory_version)
+async def view_subcategory(request, subcategory_id):
+    catalogue = await aget_catalogue()
+    subcategory = catalogue.subcategory(subcategory_id)
+    items = await astocked_items(catalogue, subcategory_id=subcategory.id)
+    return render(request, 'consumables/view_subcategory.html', {
+        'subcategory': subcategory,
+        'items': items
+    })
+
+
+@async_login_required
+async def today(request):
+    records, cursor = await feeds.apage(today_records(), request.GET.get('cursor'))
+    return render(request, 'consumables/today.html', {'records': records, 'next_url': feed_next_url('today', cursor)})
+
+
+@async_login_required
+@versioned_page(inventory_version)
+async def stock_list(request):
+    categories = [c async for c in Category.objects.all()]
+    count_mode = request.GET.get('mode') == 'count'
+    keys = {c.id: make_template_fragment_key('stock_category', [c.id, c.version, count_mode]) for c in categories}
+    cached = await cache.aget_many(keys.values())
+    await aprefetch_related_objects([c for c in categories if keys[c.id] not in cached], 'items')
+    # Cached categories read category.items only if their fragment is gone by render()
+    return await render_cached(request, 'consumables/stock_list.html', {
+        'categories': categories,
+        'count_mode': count_mode
+    }, loaded=not cached)
+
+
+@async_login_required
+@versioned_page(inventory_version)
+async def low_stock_list(request):
+    items = [i async for i in low_stock_items()]
+    return render(request, 'consumables/low_stock_list.html', {'items': items})
+
+
+@async_login_required
+async def profile(request, user_id=None):
+    if user_id and request.user.is_superuser:
+        profile_user = await aget_object_or_404(User, pk=user_id)
+    else:
+        profile_user = request.user
+    inventory_list, total_credits = profile_inventory([r async for r in profile_records(profile_user)])
+    return render(request, 'consumables/profile.html', {
+        'inventory': inventory_list,
+        'total_credits': total_credits,
+        'profile_user': profile_user
+    })
+
+
+@async_login_required
+async def leaderboard(request):
+    lifetime_data = lifetime_leaderboard([c async for c in lifetime_credits()])
+    today = timezone.localtime(timezone.now()).date()
+    start_date = leaderboard_week(today)
+    weekly_winner = None
+    leader = await ledger.aweekly_leader(start_date)
+    if leader:
+        weekly_winner = {'user': leader.user, 'score': leader.credits}
+    return render(request, 'consumables/leaderboard.html', {
+        'lifetime_leaderboard': lifetime_data,
+        'weekly_winner': weekly_winner,
+        'is_friday': today.weekday() == 4,
+        'start_date': start_date
+    })
@@ -0,0 +1,71 @@
+"""
+Authentication backend that keeps users in the cache.
+
+Every page is login_required, so every request loads the session and then the
+user. With cached_db sessions (settings.SESSION_ENGINE) the session is already
+a cache hit; this backend makes the user one too, so the usual request
+reaches the view without a database read. Saving or deleting a user, as
+edit_staff and delete_staff do, drops the cached copy.
+
+The cache (a file or a shared server, depending on CACHE_BACKEND) never sees
+the password hash: only the fields requests read, plus the session hash
+derived from the password that login sessions are checked against. The
+rebuilt User leaves every other field deferred, so it still loads them on
+access and saving it can't overwrite them.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+CACHED_FIELDS = ('id', 'username', 'first_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def to_cache(user):
+    return {**{name: getattr(user, name) for name in CACHED_FIELDS}, 'session_hash': user.get_session_auth_hash()}
+
+
+def from_cache(data):
+    # from_db() takes the values in field order and defers the fields left out
+    names = [f.attname for f in User._meta.concrete_fields if f.attname in CACHED_FIELDS]
+    user = User.from_db(None, names, [data[name] for name in names])
+    # SessionMiddleware compares this with the session; without it the deferred password would be read
+    user.get_session_auth_hash = lambda: data['session_hash']
+    return user
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        data = cache.get(cache_key(user_id))
+        if data is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(cache_key(user_id), to_cache(user), settings.USER_CACHE_SECONDS)
+        else:
+            user = from_cache(data)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        data = await cache.aget(cache_key(user_id))
+        if data is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await cache.aset(cache_key(user_id), to_cache(user), settings.USER_CACHE_SECONDS)
+        else:
+            user = from_cache(data)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Every login saves last_login alone; a stale last_login doesn't matter for auth
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    cache.delete(cache_key(instance.pk))
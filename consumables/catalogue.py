@@ -0,0 +1,161 @@
+"""
+Per-process snapshot of the catalogue tree.
+
+Names and hierarchy (categories, subcategories, item names and scores) rarely
+change, so each worker keeps them in slotted objects keyed by id and reloads
+only when the 'catalogue' StoreVersion token moves. Views that need stock
+numbers fetch just those columns with stocked_items(), one values_list() query.
+"""
+import threading
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+
+from . import versioning
+from .models import Category, SubCategory, Item, STOCK_BAND_COLORS
+
+
+class CategoryNode:
+    __slots__ = ('id', 'name', 'subcategory_ids', 'item_ids')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.subcategory_ids = []
+        self.item_ids = []
+
+
+class SubCategoryNode:
+    __slots__ = ('id', 'name', 'category_id', 'item_ids')
+
+    def __init__(self, id, name, category_id):
+        self.id = id
+        self.name = name
+        self.category_id = category_id
+        self.item_ids = []
+
+
+class ItemNode:
+    __slots__ = ('id', 'name', 'score', 'category_id', 'subcategory_id')
+
+    def __init__(self, id, name, score, category_id, subcategory_id):
+        self.id = id
+        self.name = name
+        self.score = score
+        self.category_id = category_id
+        self.subcategory_id = subcategory_id
+
+
+class StockedItem:
+    """Catalogue item joined with freshly read stock columns, usable wherever templates expect an Item."""
+    __slots__ = ('id', 'name', 'score', 'category_id', 'subcategory_id',
+                 'average_stock', 'current_stock', 'usage_count', 'stock_ratio', 'stock_band')
+
+    def __init__(self, node, average_stock, current_stock, usage_count, stock_ratio, stock_band):
+        self.id = node.id
+        self.name = node.name
+        self.score = node.score
+        self.category_id = node.category_id
+        self.subcategory_id = node.subcategory_id
+        self.average_stock = average_stock
+        self.current_stock = current_stock
+        self.usage_count = usage_count
+        self.stock_ratio = stock_ratio
+        self.stock_band = stock_band
+
+    def stock_percentage(self):
+        return self.stock_ratio * 100
+
+    def stock_status_color(self):
+        return STOCK_BAND_COLORS[self.stock_band]
+
+
+class Catalogue:
+    __slots__ = ('token', 'categories', 'subcategories', 'items')
+
+    def __init__(self, token):
+        self.token = token
+        self.categories = {}
+        self.subcategories = {}
+        self.items = {}
+
+    @classmethod
+    def load(cls, token):
+        catalogue = cls(token)
+        for id, name in Category.objects.order_by('id').values_list('id', 'name'):
+            catalogue.categories[id] = CategoryNode(id, name)
+        for id, name, category_id in SubCategory.objects.order_by('id').values_list('id', 'name', 'category_id'):
+            catalogue.subcategories[id] = SubCategoryNode(id, name, category_id)
+            catalogue.categories[category_id].subcategory_ids.append(id)
+        rows = Item.objects.order_by('name').values_list('id', 'name', 'score', 'category_id', 'subcategory_id')
+        for row in rows:
+            node = ItemNode(*row)
+            catalogue.items[node.id] = node
+            catalogue.categories[node.category_id].item_ids.append(node.id)
+            if node.subcategory_id is not None:
+                catalogue.subcategories[node.subcategory_id].item_ids.append(node.id)
+        return catalogue
+
+    def category(self, category_id):
+        try:
+            return self.categories[category_id]
+        except KeyError:
+            raise Http404("No Category matches the given query.")
+
+    def subcategory(self, subcategory_id):
+        try:
+            return self.subcategories[subcategory_id]
+        except KeyError:
+            raise Http404("No SubCategory matches the given query.")
+
+    def subcategories_of(self, category_id):
+        return [self.subcategories[i] for i in self.category(category_id).subcategory_ids]
+
+
+_current = None
+_lock = threading.Lock()
+
+
+def get_catalogue():
+    """The catalogue for the current 'catalogue' token; one small query when nothing changed."""
+    global _current
+    token = versioning.current(versioning.CATALOGUE)
+    catalogue = _current
+    if catalogue is None or catalogue.token != token:
+        with _lock:
+            catalogue = _current
+            if catalogue is None or catalogue.token != token:
+                catalogue = _current = Catalogue.load(token)
+    return catalogue
+
+
+async def aget_catalogue():
+    token = await versioning.acurrent(versioning.CATALOGUE)
+    catalogue = _current
+    if catalogue is None or catalogue.token != token:
+        # A reload is rare; do it on the ORM thread under the same lock as get_catalogue()
+        catalogue = await sync_to_async(get_catalogue)()
+    return catalogue
+
+
+def _stock_rows(**filters):
+    return Item.objects.filter(**filters).values_list(
+        'id', 'average_stock', 'current_stock', 'usage_count', 'stock_ratio', 'stock_band'
+    )
+
+
+def _stocked(catalogue, id, *stock):
+    node = catalogue.items.get(id)
+    # None when created after this snapshot; it shows up once the token moves
+    return None if node is None else StockedItem(node, *stock)
+
+
+def stocked_items(catalogue, **filters):
+    """Items matching ``filters`` in display order, names from the catalogue and stock read fresh."""
+    items = (_stocked(catalogue, *row) for row in _stock_rows(**filters))
+    return [item for item in items if item is not None]
+
+
+async def astocked_items(catalogue, **filters):
+    items = [_stocked(catalogue, *row) async for row in _stock_rows(**filters)]
+    return [item for item in items if item is not None]
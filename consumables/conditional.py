@@ -0,0 +1,104 @@
+"""
+Conditional GET for pages whose content follows a store version.
+
+@versioned_page(lookup) tags a view's responses with an ETag (and
+Last-Modified when the version has a timestamp) and answers a matching
+If-None-Match / If-Modified-Since with 304 Not Modified straight after the
+lookup, before the view queries items or renders a template.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from . import versioning
+from .models import Category, SubCategory
+
+
+def inventory_version(request, **kwargs):
+    return versioning.stamp(versioning.INVENTORY)
+
+
+def catalogue_version(request, **kwargs):
+    return versioning.stamp(versioning.CATALOGUE)
+
+
+def category_version(request, category_id, **kwargs):
+    version = Category.objects.filter(pk=category_id).values_list('version', flat=True).first()
+    return None if version is None else (version, None)
+
+
+def subcategory_version(request, subcategory_id, **kwargs):
+    version = SubCategory.objects.filter(pk=subcategory_id).values_list('category__version', flat=True).first()
+    return None if version is None else (version, None)
+
+
+def page_etag(request, version):
+    # The same version renders differently per user, query string and CSRF secret
+    # (forms embed the token), so all of them are part of the tag
+    get_token(request)  # Makes sure the secret exists already on a first visit
+    user = request.user
+    viewer = f"{request.get_full_path()}|{user.pk}|{user.is_superuser}|{request.META['CSRF_COOKIE']}"
+    digest = hashlib.md5(viewer.encode(), usedforsecurity=False).hexdigest()[:16]
+    return quote_etag(f"{version}-{digest}")
+
+
+def versioned_page(lookup):
+    """
+    ``lookup(request, **kwargs)`` returns (version, last modified datetime or None),
+    or None when the object is missing so the view can answer 404 itself.
+    Works on sync and async views; async views must have request.user resolved.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not wants_check(request):
+                    return await view(request, *args, **kwargs)
+                found = await sync_to_async(lookup)(request, **kwargs)
+                if found is None:
+                    return await view(request, *args, **kwargs)
+                etag, last_modified = validators(request, *found)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return finish(response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not wants_check(request):
+                return view(request, *args, **kwargs)
+            found = lookup(request, **kwargs)
+            if found is None:
+                return view(request, *args, **kwargs)
+            etag, last_modified = validators(request, *found)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return finish(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def wants_check(request):
+    # A pending flash message has to be shown, so never 304 over it
+    return request.method in ('GET', 'HEAD') and not len(messages.get_messages(request))
+
+
+def validators(request, version, modified):
+    return page_etag(request, version), int(modified.timestamp()) if modified else None
+
+
+def finish(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+    # Let browsers keep the page but always revalidate it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
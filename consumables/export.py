@@ -0,0 +1,103 @@
+"""
+Streaming consumption exports (CSV or JSONL, optionally gzipped).
+
+Rows come from a values_list() query joined with user, item and category
+names, read in chunks with iterator(chunk_size=...) and encoded batch by batch, so memory
+stays flat whatever the size of the history. The same encoder feeds the
+export_consumption view (sync iterator under WSGI, async under ASGI, where
+Django would otherwise buffer a sync iterator whole) and the
+export_consumption management command.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import ConsumptionRecord
+
+FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 2000
+
+FIELDS = ('id', 'date', 'time', 'user', 'user_name', 'category', 'subcategory', 'item', 'quantity', 'credits')
+COLUMNS = (
+    'id', 'date', 'timestamp', 'user__username', 'user__first_name', 'item__category__name',
+    'item__subcategory__name', 'item__name', 'quantity', 'credits',
+)
+
+
+def parse_filters(params):
+    """Filters from ``start``/``end`` (YYYY-MM-DD), ``user`` and ``category`` (ids); ValueError if malformed."""
+    filters = {}
+    if params.get('start'):
+        filters['date__gte'] = date.fromisoformat(params['start'])
+    if params.get('end'):
+        filters['date__lte'] = date.fromisoformat(params['end'])
+    if params.get('user'):
+        filters['user_id'] = int(params['user'])
+    if params.get('category'):
+        filters['item__category_id'] = int(params['category'])
+    return filters
+
+
+def export_rows(filters):
+    # Same order as consumption_feed_idx, oldest first
+    return ConsumptionRecord.objects.filter(**filters).order_by('date', 'timestamp', 'id').values_list(*COLUMNS)
+
+
+def filename(format, compress):
+    return f"consumption-{timezone.localdate().isoformat()}.{format}" + ('.gz' if compress else '')
+
+
+class Encoder:
+    """Turns batches of export rows into bytes; call finish() once for the trailing gzip data."""
+
+    def __init__(self, format, compress=False):
+        self.format = format
+        self.compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        if format == 'csv':
+            self.writer.writerow(FIELDS)
+
+    def encode(self, rows):
+        for row in rows:
+            values = list(row)
+            values[2] = timezone.localtime(values[2]).isoformat(timespec='seconds')
+            if self.format == 'csv':
+                self.writer.writerow(values)
+            else:
+                values[1] = values[1].isoformat()
+                self.buffer.write(json.dumps(dict(zip(FIELDS, values))) + '\n')
+        data = self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return self.compressor.compress(data) if self.compressor else data
+
+    def finish(self):
+        return self.compressor.flush() if self.compressor else b''
+
+
+def stream(filters, format, compress=False):
+    encoder = Encoder(format, compress)
+    rows = export_rows(filters).iterator(chunk_size=CHUNK_SIZE)
+    while batch := list(islice(rows, CHUNK_SIZE)):
+        if data := encoder.encode(batch):
+            yield data
+    yield encoder.encode(()) + encoder.finish()
+
+
+async def astream(filters, format, compress=False):
+    # QuerySet.aiterator() runs a values_list() query on the event loop thread,
+    # so pull each chunk of the sync iterator through sync_to_async instead
+    encoder = Encoder(format, compress)
+    rows = export_rows(filters).iterator(chunk_size=CHUNK_SIZE)
+    next_batch = sync_to_async(lambda: list(islice(rows, CHUNK_SIZE)))
+    while batch := await next_batch():
+        if data := encoder.encode(batch):
+            yield data
+    yield encoder.encode(()) + encoder.finish()
@@ -0,0 +1,60 @@
+"""
+Keyset (cursor) pagination for the consumption feeds.
+
+Feeds run newest first over (date, timestamp, id), the columns of
+consumption_feed_idx. A cursor is the key of the last row shown, so the next
+page is an index range scan that starts where the previous one stopped and
+costs the same however deep the reader has scrolled, unlike OFFSET. The
+JSON API pages values_list() rows the same way, passing its own ``key``.
+"""
+from datetime import date, datetime
+from operator import attrgetter
+
+from django.core.exceptions import BadRequest
+from django.db.models import Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+PAGE_SIZE = 50
+ORDER = ('-date', '-timestamp', '-id')
+record_key = attrgetter('date', 'timestamp', 'id')
+
+
+def encode_cursor(key):
+    day, stamp, id = key
+    return urlsafe_base64_encode(f"{day.isoformat()}|{stamp.isoformat()}|{id}".encode())
+
+
+def decode_cursor(cursor):
+    try:
+        day, stamp, id = urlsafe_base64_decode(cursor).decode().split('|')
+        return date.fromisoformat(day), datetime.fromisoformat(stamp), int(id)
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequest("Invalid feed cursor")
+
+
+def after(queryset, cursor=None, size=PAGE_SIZE):
+    """One page (plus one row to tell whether more follow) of ``queryset`` past ``cursor``."""
+    queryset = queryset.order_by(*ORDER)
+    if cursor:
+        day, stamp, id = decode_cursor(cursor)
+        # date <= day leads so the index range starts at the cursor's day
+        queryset = queryset.filter(date__lte=day).filter(
+            Q(date__lt=day) | Q(timestamp__lt=stamp) | Q(timestamp=stamp, id__lt=id)
+        )
+    return queryset[:size + 1]
+
+
+def _split(rows, size, key):
+    if len(rows) > size:
+        rows = rows[:size]
+        return rows, encode_cursor(key(rows[-1]))
+    return rows, None
+
+
+def page(queryset, cursor=None, size=PAGE_SIZE, key=record_key):
+    """(records, next cursor or None); ``key`` gives a row's (date, timestamp, id)."""
+    return _split(list(after(queryset, cursor, size)), size, key)
+
+
+async def apage(queryset, cursor=None, size=PAGE_SIZE, key=record_key):
+    return _split([record async for record in after(queryset, cursor, size)], size, key)
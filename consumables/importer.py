@@ -0,0 +1,149 @@
+"""
+Bulk catalogue and stock import from CSV or JSON.
+
+Each row names an item by category, optional subcategory and item name, with
+average_stock, current_stock and score. Categories and subcategories that
+don't exist yet are created, items are created or updated, all in one
+transaction: a handful of queries to load name -> id maps and a few bulk
+writes, however many rows there are. With dry_run the same work is done and
+then rolled back, so the returned diff is exactly what a real run would do.
+"""
+import csv
+import io
+import json
+
+from django.db import transaction
+
+from . import live, versioning
+from .models import Category, SubCategory, Item
+
+COLUMNS = ('category', 'subcategory', 'name', 'average_stock', 'current_stock', 'score')
+ITEM_FIELDS = ('average_stock', 'current_stock', 'score')
+BATCH_SIZE = 500
+
+
+class InvalidImport(ValueError):
+    """Malformed import data; ``errors`` lists one message per bad row."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def parse(data, format=None):
+    """Rows from CSV (header line naming COLUMNS) or a JSON list of objects; format is guessed if not given."""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    if format is None:
+        format = 'json' if data.lstrip().startswith('[') else 'csv'
+    try:
+        raw = json.loads(data) if format == 'json' else list(csv.DictReader(io.StringIO(data)))
+    except ValueError as e:
+        raise InvalidImport([f"Could not read {format}: {e}"])
+
+    rows, errors = [], []
+    for number, entry in enumerate(raw, start=1):
+        try:
+            row = {
+                'category': str(entry['category']).strip(),
+                'subcategory': str(entry.get('subcategory') or '').strip() or None,
+                'name': str(entry['name']).strip(),
+                'average_stock': float(entry.get('average_stock') or 0),
+                'current_stock': float(entry.get('current_stock') or 0),
+                'score': int(entry.get('score') or 1),
+            }
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            errors.append(f"Row {number}: {e!r}")
+            continue
+        if not row['category'] or not row['name']:
+            errors.append(f"Row {number}: category and name are required")
+            continue
+        rows.append(row)
+    if errors:
+        raise InvalidImport(errors)
+    return rows
+
+
+def label(row):
+    return " / ".join(part for part in (row['category'], row['subcategory'], row['name']) if part)
+
+
+@transaction.atomic
+def apply(rows, dry_run=False):
+    """
+    Upsert ``rows`` and return the diff:
+    {'categories': [...], 'subcategories': [...], 'created': [...], 'updated': [...], 'unchanged': n}
+    """
+    report = {'categories': [], 'subcategories': [], 'created': [], 'updated': [], 'unchanged': 0}
+    # Later rows for the same item win
+    rows = list({(r['category'], r['subcategory'], r['name']): r for r in rows}.values())
+
+    # Categories: name -> id, creating the missing ones
+    categories = dict(Category.objects.values_list('name', 'id'))
+    new = sorted({r['category'] for r in rows} - categories.keys())
+    for category in Category.objects.bulk_create([Category(name=name) for name in new]):
+        categories[category.name] = category.id
+    report['categories'] = new
+
+    # Subcategories: (category id, name) -> id
+    subcategories = {(c, name): id for id, c, name in SubCategory.objects.values_list('id', 'category_id', 'name')}
+    wanted = {(categories[r['category']], r['subcategory']): r for r in rows if r['subcategory']}
+    missing = [key for key in wanted if key not in subcategories]
+    created = SubCategory.objects.bulk_create([SubCategory(category_id=c, name=name) for c, name in missing])
+    for sub in created:
+        subcategories[(sub.category_id, sub.name)] = sub.id
+    report['subcategories'] = sorted(f"{wanted[key]['category']} / {key[1]}" for key in missing)
+
+    # Items, keyed the way unique_direct_item_idx and unique_subcategory_item_idx key them
+    category_ids = {categories[r['category']] for r in rows}
+    existing = {}
+    for item in Item.objects.filter(category_id__in=category_ids):
+        key = ('sub', item.subcategory_id, item.name) if item.subcategory_id else ('direct', item.category_id, item.name)
+        existing[key] = item
+
+    direct_new, sub_new, changed = [], [], []
+    for row in rows:
+        category_id = categories[row['category']]
+        subcategory_id = subcategories[(category_id, row['subcategory'])] if row['subcategory'] else None
+        key = ('sub', subcategory_id, row['name']) if subcategory_id else ('direct', category_id, row['name'])
+        item = existing.get(key)
+        if item is None:
+            item = Item(category_id=category_id, subcategory_id=subcategory_id, name=row['name'],
+                        **{f: row[f] for f in ITEM_FIELDS})
+            item.update_stock_status()
+            (sub_new if subcategory_id else direct_new).append(item)
+            report['created'].append(label(row))
+            continue
+        changes = {f: (getattr(item, f), row[f]) for f in ITEM_FIELDS if getattr(item, f) != row[f]}
+        if not changes:
+            report['unchanged'] += 1
+            continue
+        for field, (_, value) in changes.items():
+            setattr(item, field, value)
+        item.update_stock_status()
+        changed.append(item)
+        report['updated'].append({'name': label(row), 'changes': changes})
+
+    # Direct items' uniqueness is a partial index, which an ON CONFLICT target can't
+    # name, so the maps above decide; subcategory items also upsert on conflict, which
+    # covers a concurrent add_item between loading the map and writing
+    Item.objects.bulk_create(direct_new, batch_size=BATCH_SIZE)
+    Item.objects.bulk_create(
+        sub_new, batch_size=BATCH_SIZE, update_conflicts=True, unique_fields=['subcategory', 'name'],
+        update_fields=[*ITEM_FIELDS, 'stock_ratio', 'stock_band'],
+    )
+    # bulk_update() builds a CASE WHEN per row and field, which costs more in Python
+    # than the write itself; an upsert on the primary key is one plain INSERT
+    Item.objects.bulk_create(
+        changed, batch_size=BATCH_SIZE, update_conflicts=True, unique_fields=['id'],
+        update_fields=[*ITEM_FIELDS, 'stock_ratio', 'stock_band'],
+    )
+
+    # Bulk writes skip the version signals
+    if new or missing or direct_new or sub_new or changed:
+        versioning.bump_categories(category_ids)
+        versioning.bump(versioning.CATALOGUE)
+        live.publish(item.id for item in changed)
+    if dry_run:
+        transaction.set_rollback(True)
+    return report
@@ -0,0 +1,236 @@
+"""
+Running credit and item totals kept next to the consumption history.
+
+Every write that adds or removes ConsumptionRecord rows calls into here inside
+its own transaction, so the leaderboard can read precomputed totals instead of
+walking the whole consumption table. Deleting an item, directly, through a
+category delete or from the admin, takes its credits back in item_deleted.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ConsumptionRecord, DailyConsumption, Item, ItemTotal, UserCredit, WeeklyScore, week_start
+
+
+def add_credits(user_id, credits):
+    if not credits:
+        return
+    updated = UserCredit.objects.filter(user_id=user_id).update(
+        lifetime_credits=F('lifetime_credits') + credits
+    )
+    if not updated:
+        # First take for this user; get_or_create absorbs a concurrent insert
+        UserCredit.objects.get_or_create(user_id=user_id)
+        UserCredit.objects.filter(user_id=user_id).update(
+            lifetime_credits=F('lifetime_credits') + credits
+        )
+
+
+def add_weekly_credits(user_id, day, credits):
+    start = week_start(day)
+    if not credits or start < current_week_start():
+        # Completed weeks are frozen so their winner never changes after the fact
+        return
+    updated = WeeklyScore.objects.filter(week_start=start, user_id=user_id).update(
+        credits=F('credits') + credits
+    )
+    if not updated:
+        WeeklyScore.objects.get_or_create(week_start=start, user_id=user_id)
+        WeeklyScore.objects.filter(week_start=start, user_id=user_id).update(
+            credits=F('credits') + credits
+        )
+
+
+def add_item_totals(user_id, totals):
+    """Add ``{item_id: (quantity, credits)}`` to the user's ItemTotal rows."""
+    totals = {item_id: total for item_id, total in totals.items() if any(total)}
+    if not totals:
+        return
+    rows = ItemTotal.objects.filter(user_id=user_id, item_id__in=totals)
+
+    def add(field, index, item_ids):
+        return F(field) + Case(
+            *[When(item_id=i, then=Value(totals[i][index])) for i in item_ids], output_field=FloatField()
+        )
+
+    # One UPDATE for every item already taken; first takes insert their row and add to it
+    updated = rows.update(quantity=add('quantity', 0, totals), credits=add('credits', 1, totals))
+    if updated < len(totals):
+        missing = set(totals) - set(rows.values_list('item_id', flat=True))
+        # ignore_conflicts absorbs a concurrent first take; its row is then updated below
+        ItemTotal.objects.bulk_create([ItemTotal(user_id=user_id, item_id=i) for i in missing], ignore_conflicts=True)
+        rows.filter(item_id__in=missing).update(quantity=add('quantity', 0, missing), credits=add('credits', 1, missing))
+
+
+def current_week_start():
+    return week_start(timezone.localtime(timezone.now()).date())
+
+
+def record_take(record):
+    add_credits(record.user_id, record.credits)
+    add_weekly_credits(record.user_id, record.date, record.credits)
+    add_item_totals(record.user_id, {record.item_id: (record.quantity, record.credits)})
+
+
+def record_takes(records):
+    """Batch form of record_take: one ledger write per user and day instead of per record."""
+    totals, items = {}, {}
+    for record in records:
+        key = (record.user_id, record.date)
+        totals[key] = totals.get(key, 0) + record.credits
+        quantity, credits = items.setdefault(record.user_id, {}).get(record.item_id, (0, 0))
+        items[record.user_id][record.item_id] = (quantity + record.quantity, credits + record.credits)
+    for (user_id, day), credits in totals.items():
+        add_credits(user_id, credits)
+        add_weekly_credits(user_id, day, credits)
+    for user_id, item_totals in items.items():
+        add_item_totals(user_id, item_totals)
+
+
+def record_delete(record):
+    add_credits(record.user_id, -record.credits)
+    add_weekly_credits(record.user_id, record.date, -record.credits)
+    add_item_totals(record.user_id, {record.item_id: (-record.quantity, -record.credits)})
+
+
+def forget_items(items):
+    # Deleting items cascades to their records, rollups and ItemTotal rows, so take their credits back first.
+    # ``items`` is a queryset or list of ids; correlated subqueries keep this at two UPDATEs
+    # however many items and users there are.
+    totals = ItemTotal.objects.filter(item__in=items)
+    UserCredit.objects.filter(user_id__in=totals.values('user_id')).update(
+        lifetime_credits=F('lifetime_credits') - item_credits(totals.filter(user_id=OuterRef('user_id')))
+    )
+    start = current_week_start()
+    weekly, users = 0.0, Q()
+    for model in (ConsumptionRecord, DailyConsumption):
+        records = model.objects.filter(item__in=items, date__gte=start)
+        weekly += item_credits(records.filter(user_id=OuterRef('user_id')))
+        users |= Q(user_id__in=records.values('user_id'))
+    WeeklyScore.objects.filter(users, week_start=start).update(credits=F('credits') - weekly)
+
+
+def forget_item(item):
+    forget_items([item.pk])
+
+
+# Ids of items already taken off the ledger by forgetting(), which item_deleted skips
+_forgotten = ContextVar('ledger_forgotten_items', default=frozenset())
+
+
+@contextmanager
+def forgetting(items):
+    """
+    Take a queryset of items off the ledger in one pass before deleting them, e.g.
+    a whole category's; without it item_deleted does the same one item at a time.
+    """
+    ids = frozenset(items.values_list('id', flat=True))
+    forget_items(items)
+    token = _forgotten.set(_forgotten.get() | ids)
+    try:
+        yield
+    finally:
+        _forgotten.reset(token)
+
+
+@receiver(pre_delete, sender=Item)
+def item_deleted(sender, instance, **kwargs):
+    # Sent for every item a delete collects (delete_item, category cascades, the admin)
+    # before any row is removed and inside the delete's transaction
+    if instance.pk not in _forgotten.get():
+        forget_item(instance)
+
+
+def item_credits(records):
+    total = records.values('user_id').annotate(total=Sum('credits')).values('total')
+    return Coalesce(Subquery(total), 0.0, output_field=FloatField())
+
+
+def weekly_leaders(start):
+    return WeeklyScore.objects.filter(week_start=start, credits__gt=0).select_related('user').order_by('-credits')
+
+
+def weekly_leader(start):
+    """Top WeeklyScore for the week starting on ``start``, or None."""
+    return weekly_leaders(start).first()
+
+
+async def aweekly_leader(start):
+    return await weekly_leaders(start).afirst()
+
+
+def history_item_totals():
+    """{(user_id, item_id): (quantity, credits)} summed from the raw records and their rollups."""
+    totals = {}
+    for model in (ConsumptionRecord, DailyConsumption):
+        rows = model.objects.values('user_id', 'item_id').annotate(
+            total_quantity=Sum('quantity'), total_credits=Sum('credits'),
+        ).order_by()
+        for row in rows:
+            quantity, credits = totals.get((row['user_id'], row['item_id']), (0, 0))
+            totals[(row['user_id'], row['item_id'])] = (quantity + row['total_quantity'], credits + row['total_credits'])
+    return totals
+
+
+@transaction.atomic
+def rebuild(all_weeks=False):
+    """
+    Recompute UserCredit, ItemTotal and this week's WeeklyScore rows from the
+    consumption history and its rollups. Completed weeks are frozen, as
+    add_weekly_credits keeps them; ``all_weeks`` recomputes them too, for a
+    freshly generated history such as seed_store's.
+    """
+    history = (ConsumptionRecord, DailyConsumption)
+    UserCredit.objects.all().delete()
+    lifetime = {}
+    for model in history:
+        for row in model.objects.values('user_id').annotate(total=Sum('credits')).order_by():
+            lifetime[row['user_id']] = lifetime.get(row['user_id'], 0) + row['total']
+    UserCredit.objects.bulk_create(
+        UserCredit(user_id=user_id, lifetime_credits=total) for user_id, total in lifetime.items()
+    )
+
+    first = date.min if all_weeks else current_week_start()
+    WeeklyScore.objects.filter(week_start__gte=first).delete()
+    buckets = {}
+    for model in history:
+        for row in model.objects.filter(date__gte=first).values('date', 'user_id').annotate(total=Sum('credits')).order_by():
+            key = (week_start(row['date']), row['user_id'])
+            buckets[key] = buckets.get(key, 0) + row['total']
+    WeeklyScore.objects.bulk_create(
+        WeeklyScore(week_start=start, user_id=user_id, credits=total)
+        for (start, user_id), total in buckets.items()
+    )
+
+    ItemTotal.objects.all().delete()
+    ItemTotal.objects.bulk_create(
+        ItemTotal(user_id=user_id, item_id=item_id, quantity=quantity, credits=credits)
+        for (user_id, item_id), (quantity, credits) in history_item_totals().items()
+    )
+    return UserCredit.objects.count()
+
+
+def check(tolerance=1e-6):
+    """
+    Compare ItemTotal with the consumption history; returns one
+    (user_id, item_id, stored, expected) tuple per mismatch, each a (quantity, credits) pair.
+    """
+    expected = history_item_totals()
+    stored = {
+        (user_id, item_id): (quantity, credits)
+        for user_id, item_id, quantity, credits in ItemTotal.objects.values_list('user_id', 'item_id', 'quantity', 'credits')
+    }
+    mismatches = []
+    for key in expected.keys() | stored.keys():
+        have, want = stored.get(key, (0, 0)), expected.get(key, (0, 0))
+        if any(abs(a - b) > tolerance for a, b in zip(have, want)):
+            mismatches.append((*key, have, want))
+    return sorted(mismatches)
@@ -0,0 +1,147 @@
+"""
+Live stock deltas pushed to kiosks over Server-Sent Events.
+
+Views that change stock call publish() with the item ids; once the transaction
+commits, the new stock and status colour of those items go out as one JSON
+list. Each ASGI worker has one Broadcaster fanning messages out to an
+asyncio.Queue per connected kiosk, so an idle connection costs a queue and a
+suspended coroutine, not a thread.
+
+With settings.LIVE_STOCK_DIR set, messages travel between processes as
+datagrams on Unix sockets in that directory: every ASGI worker with listeners
+binds <dir>/<pid>.sock and publishers (ASGI or WSGI workers alike) send to
+every socket there. Without it only the publishing process's own kiosks hear
+about a change, which is enough for a single ASGI worker.
+"""
+import asyncio
+import contextlib
+import glob
+import json
+import os
+import socket
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Item, STOCK_BAND_COLORS
+
+# Undelivered messages kept per kiosk; a slow reader loses the oldest first
+QUEUE_SIZE = 100
+# Deltas per message, so a whole stock count fits in one datagram
+CHUNK_SIZE = 200
+
+
+def _directory():
+    return getattr(settings, 'LIVE_STOCK_DIR', None)
+
+
+class Broadcaster:
+    def __init__(self):
+        self.loop = None
+        self.sock = None
+        self.subscribers = set()
+
+    def subscribe(self):
+        """New queue for one kiosk; must be called from the event loop serving it."""
+        self._start()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        self.close()
+        # Queues made on the old loop can never be woken from this one
+        self.subscribers.clear()
+        self.loop = loop
+        directory = _directory()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{os.getpid()}.sock')
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(path)
+            self.sock.setblocking(False)
+            loop.add_reader(self.sock.fileno(), self._receive)
+
+    def close(self):
+        if self.sock is not None:
+            with contextlib.suppress(Exception):
+                self.loop.remove_reader(self.sock.fileno())
+            with contextlib.suppress(OSError):
+                os.unlink(self.sock.getsockname())
+            self.sock.close()
+            self.sock = None
+        self.loop = None
+
+    def _receive(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.deliver(data.decode())
+
+    def deliver(self, message):
+        """Queue ``message`` for every kiosk; runs on the event loop."""
+        for queue in list(self.subscribers):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    def deliver_threadsafe(self, message):
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.deliver, message)
+
+
+broadcaster = Broadcaster()
+
+
+def publish(item_ids):
+    """Push the stock of ``item_ids`` to kiosks once the current transaction commits."""
+    ids = list(item_ids)
+    # Nobody can be listening: skip the read-back query
+    if ids and (_directory() or broadcaster.subscribers):
+        transaction.on_commit(lambda: send(ids))
+
+
+def send(item_ids):
+    rows = Item.objects.filter(pk__in=item_ids).values_list('id', 'current_stock', 'stock_ratio', 'stock_band')
+    deltas = [
+        {'id': id, 'stock': stock, 'color': STOCK_BAND_COLORS[band], 'percentage': round(ratio * 100)}
+        for id, stock, ratio, band in rows
+    ]
+    for start in range(0, len(deltas), CHUNK_SIZE):
+        message = json.dumps(deltas[start:start + CHUNK_SIZE])
+        if _directory():
+            _send_to_workers(message)
+        else:
+            broadcaster.deliver_threadsafe(message)
+
+
+_sender = None
+
+
+def _send_to_workers(message):
+    global _sender
+    if _sender is None:
+        _sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        _sender.setblocking(False)
+    data = message.encode()
+    for path in glob.glob(os.path.join(_directory(), '*.sock')):
+        try:
+            _sender.sendto(data, path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Worker is gone; drop its socket so later sends skip it
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+        except BlockingIOError:
+            # That worker's buffer is full; kiosks catch up on their next reload
+            pass
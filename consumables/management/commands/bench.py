@@ -0,0 +1,159 @@
+import json
+import platform
+import time
+from io import StringIO
+
+import django
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from consumables.models import Item, ConsumptionRecord
+from consumables.profiling import QueryTimer, track_templates
+from consumables.urls import urlpatterns
+
+# GET pages worth timing. Views whose GET deletes or logs out are left out,
+# as are POST-only endpoints.
+BENCH_VIEWS = [
+    'home', 'login', 'view_category', 'view_subcategory', 'take_item', 'take_cart', 'today', 'history',
+    'stock_list', 'low_stock_list', 'manage_categories', 'category_detail', 'add_category',
+    'edit_category', 'add_subcategory', 'edit_subcategory', 'add_item', 'edit_item',
+    'profile', 'profile_view', 'leaderboard', 'manage_staff', 'stock_history', 'add_staff', 'edit_staff',
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Benchmark view latency against seeded stores of several sizes and compare with a JSON baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[1000, 100000, 1000000],
+                            help="Consumption record counts to seed, one run per scale")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per view")
+        parser.add_argument('--views', nargs='+', default=BENCH_VIEWS, help="URL names to benchmark")
+        parser.add_argument('--output', help="Write results to this JSON file")
+        parser.add_argument('--baseline', help="Compare against results from an earlier run")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Allowed relative p95 slowdown before flagging a regression")
+
+    def handle(self, *args, **options):
+        # Everything runs in a throwaway test database, never the real store
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = {}
+            for scale in options['scales']:
+                self.stdout.write(f"Seeding {scale} consumption records...")
+                self.seed(scale)
+                results[str(scale)] = self.run_scale(options['views'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+            },
+            'results': results,
+        }
+        self.print_table(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = self.compare(baseline['results'], results, options['threshold'])
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
+
+    def seed(self, records):
+        call_command('flush', interactive=False, verbosity=0)
+        self.admin = User.objects.create_superuser(username='bench', password='bench')
+        call_command('seed_store', records=records, days=365, stdout=StringIO())
+
+    def url_kwargs(self):
+        item = Item.objects.filter(subcategory__isnull=False).order_by('-usage_count').first()
+        staff = User.objects.filter(is_superuser=False).first()
+        record = ConsumptionRecord.objects.order_by('-id').first()
+        return {
+            'category_id': item.category_id,
+            'subcategory_id': item.subcategory_id,
+            'item_id': item.id,
+            'record_id': record.id,
+            'user_id': staff.id,
+        }
+
+    def run_scale(self, names, repeat):
+        client = Client()
+        client.force_login(self.admin)
+        kwargs = self.url_kwargs()
+        patterns = {p.name: p for p in urlpatterns}
+
+        results = {}
+        for name in names:
+            params = {k: kwargs[k] for k in patterns[name].pattern.converters}
+            url = reverse(name, kwargs=params)
+            client.get(url)  # warm caches and connections
+
+            latencies, db_times, template_times, queries = [], [], [], 0
+            for _ in range(repeat):
+                timer = QueryTimer()
+                with connection.execute_wrapper(timer), track_templates() as templates:
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    raise CommandError(f"{url} returned {response.status_code}")
+                db_times.append(timer.duration)
+                template_times.append(templates.duration)
+                queries = timer.count
+
+            results[name] = {
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+                'queries': queries,
+                'db_ms': round(percentile(db_times, 50) * 1000, 3),
+                'template_ms': round(percentile(template_times, 50) * 1000, 3),
+            }
+        return results
+
+    def print_table(self, results):
+        for scale, views in results.items():
+            self.stdout.write(f"\n{scale} records")
+            self.stdout.write(f"{'view':<20}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'db ms':>10}{'tpl ms':>10}")
+            for name, r in views.items():
+                self.stdout.write(
+                    f"{name:<20}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['queries']:>9}"
+                    f"{r['db_ms']:>10.2f}{r['template_ms']:>10.2f}"
+                )
+
+    def compare(self, baseline, results, threshold):
+        regressions = []
+        for scale, views in results.items():
+            for name, r in views.items():
+                old = baseline.get(scale, {}).get(name)
+                if not old:
+                    continue
+                if r['p95_ms'] > old['p95_ms'] * (1 + threshold):
+                    regressions.append(f"[{scale}] {name}: p95 {old['p95_ms']}ms -> {r['p95_ms']}ms")
+                if r['queries'] > old['queries']:
+                    regressions.append(f"[{scale}] {name}: queries {old['queries']} -> {r['queries']}")
+        return regressions
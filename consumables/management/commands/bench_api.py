@@ -0,0 +1,114 @@
+import gzip
+import json
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from consumables.models import Item
+from consumables.profiling import QueryTimer
+
+from .bench import percentile
+
+
+class Command(BaseCommand):
+    help = "Compare bytes, latency and queries per call of the JSON API against the HTML pages it replaces"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=20000, help="Consumption records to seed")
+        parser.add_argument('--repeat', type=int, default=30, help="Timed calls per endpoint")
+        parser.add_argument('--output', help="Write results to this JSON file")
+
+    def handle(self, *args, **options):
+        # Everything runs in a throwaway test database, never the real store
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Seeding {options['records']} consumption records...")
+            admin = User.objects.create_superuser(username='bench', password='bench')
+            call_command('seed_store', records=options['records'], days=30, stdout=StringIO())
+            # Enough stock that no timed take is refused
+            Item.objects.update(current_stock=10 ** 6, average_stock=10 ** 6)
+            results = self.run(admin, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(
+            f"\n{'call':<34}{'bytes':>9}{'gzip':>8}{'p50 ms':>9}{'p95 ms':>9}{'queries':>9}"
+        )
+        for task, calls in results.items():
+            for kind, r in calls.items():
+                self.stdout.write(
+                    f"{task + ' ' + kind:<34}{r['bytes']:>9}{r['gzip_bytes']:>8}{r['p50_ms']:>9.2f}"
+                    f"{r['p95_ms']:>9.2f}{r['queries']:>9}"
+                )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'options': {k: options[k] for k in ('records', 'repeat')}, 'results': results}, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def calls(self):
+        """{task: {'html': call, 'api': call}}; a call is (method, url, data, follow)."""
+        item = Item.objects.order_by('-usage_count').first()
+        take = {'item': item.id, 'quantity': 1}
+        return {
+            'catalogue': {
+                'html': ('get', reverse('home'), None, False),
+                'api': ('get', reverse('api_catalogue'), None, False),
+            },
+            'item stock': {
+                'html': ('get', reverse('stock_list'), None, False),
+                'api': ('get', reverse('api_items') + '?limit=500', None, False),
+            },
+            'today': {
+                'html': ('get', reverse('today'), None, False),
+                'api': ('get', reverse('api_today') + '?limit=50', None, False),
+            },
+            'leaderboard': {
+                'html': ('get', reverse('leaderboard'), None, False),
+                'api': ('get', reverse('api_leaderboard'), None, False),
+            },
+            # A scraper posts the form and then reads the page it is redirected to
+            'take': {
+                'html': ('post', reverse('take_item', args=[item.id]), {'quantity': '1'}, True),
+                'api': ('post', reverse('api_take'), take, False),
+            },
+        }
+
+    def run(self, admin, repeat):
+        client = Client()
+        client.force_login(admin)
+        results = {}
+        for task, calls in self.calls().items():
+            results[task] = {}
+            for kind, (method, url, data, follow) in calls.items():
+                def call():
+                    if method == 'get':
+                        return client.get(url)
+                    if kind == 'api':
+                        return client.post(url, data, content_type='application/json')
+                    return client.post(url, data, follow=follow)
+
+                call()  # warm caches and connections
+                latencies = []
+                for _ in range(repeat):
+                    timer = QueryTimer()
+                    with connection.execute_wrapper(timer):
+                        start = time.perf_counter()
+                        response = call()
+                        latencies.append(time.perf_counter() - start)
+                    if response.status_code >= 400:
+                        raise CommandError(f"{url} returned {response.status_code}")
+                body = response.content
+                results[task][kind] = {
+                    'bytes': len(body),
+                    'gzip_bytes': len(gzip.compress(body)),
+                    'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                    'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+                    'queries': timer.count,
+                }
+        return results
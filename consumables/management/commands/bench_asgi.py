@@ -0,0 +1,133 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from consumables import async_views, views
+from consumables.urls import build_urlpatterns
+
+from .bench import Command as BenchCommand, percentile
+
+# Pages that have a native async version in consumables.async_views
+ASYNC_VIEWS = [
+    'home', 'view_category', 'view_subcategory', 'today', 'stock_list', 'low_stock_list', 'profile', 'leaderboard',
+]
+
+
+def urlconf(name, read_views):
+    module = ModuleType(name)
+    module.urlpatterns = build_urlpatterns(read_views)
+    return module
+
+
+class Command(BaseCommand):
+    help = "Compare throughput of the sync views under WSGI with their async versions under ASGI"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=100000, help="Consumption records to seed")
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help="Worker threads (WSGI) or concurrent requests (ASGI)")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per view and mode")
+        parser.add_argument('--views', nargs='+', default=ASYNC_VIEWS, help="URL names to benchmark")
+        parser.add_argument('--output', help="Write results to this JSON file")
+
+    def handle(self, *args, **options):
+        # Same throwaway database and seeding as the latency bench
+        bench = BenchCommand(stdout=self.stdout, stderr=self.stderr)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Seeding {options['records']} consumption records...")
+            bench.seed(options['records'])
+            client = Client()
+            client.force_login(bench.admin)
+            self.session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            kwargs = bench.url_kwargs()
+
+            results = {}
+            for name in options['views']:
+                with override_settings(ROOT_URLCONF=urlconf('sync_urls', views)):
+                    url = self.url(name, kwargs)
+                    wsgi = self.run_wsgi(url, options['requests'], options['concurrency'])
+                with override_settings(ROOT_URLCONF=urlconf('async_urls', async_views)):
+                    asgi = asyncio.run(self.run_asgi(url, options['requests'], options['concurrency']))
+                results[name] = {'wsgi': wsgi, 'asgi': asgi}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"\n{'view':<20}{'wsgi req/s':>12}{'asgi req/s':>12}{'wsgi p95':>10}{'asgi p95':>10}")
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<20}{r['wsgi']['rps']:>12.1f}{r['asgi']['rps']:>12.1f}"
+                f"{r['wsgi']['p95_ms']:>10.2f}{r['asgi']['p95_ms']:>10.2f}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'options': {k: options[k] for k in ('records', 'concurrency', 'requests')},
+                           'results': results}, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def url(self, name, kwargs):
+        params = {k: kwargs[k] for k in {
+            'view_category': ['category_id'], 'view_subcategory': ['subcategory_id'],
+        }.get(name, [])}
+        return reverse(name, kwargs=params)
+
+    def login(self, client):
+        # Every client shares the admin's session but keeps its own cookie jar
+        client.cookies[settings.SESSION_COOKIE_NAME] = self.session
+        return client
+
+    def expect_ok(self, url, response):
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+
+    def summary(self, latencies, elapsed):
+        return {
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        }
+
+    def run_wsgi(self, url, requests, concurrency):
+        local = threading.local()
+
+        def fetch(_):
+            if not hasattr(local, 'client'):
+                local.client = self.login(Client())
+            start = time.perf_counter()
+            self.expect_ok(url, local.client.get(url))
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(fetch, range(concurrency)))  # warm every thread's client and connection
+            start = time.perf_counter()
+            latencies = list(pool.map(fetch, range(requests)))
+            elapsed = time.perf_counter() - start
+        return self.summary(latencies, elapsed)
+
+    async def run_asgi(self, url, requests, concurrency):
+        clients = [self.login(AsyncClient()) for _ in range(concurrency)]
+        queue = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(i)
+        latencies = []
+
+        async def worker(client):
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                self.expect_ok(url, await client.get(url))
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(client.get(url) for client in clients))  # warm up
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for client in clients))
+        return self.summary(latencies, time.perf_counter() - start)
@@ -0,0 +1,139 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError
+from django.test import Client
+from django.urls import reverse
+
+from consumables import metrics
+from consumables.models import Item
+
+from .bench import percentile
+
+PROFILES = ('basic', 'production')
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer take_item and take_cart from several worker processes on a fresh SQLite file and compare "
+        "throughput and lock errors under the basic and production SQLite profiles"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent worker processes")
+        parser.add_argument('--takes', type=int, default=200, help="Takes (single items or carts) per worker")
+        parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+        parser.add_argument('--output', help="Write results to this JSON file")
+        # Internal: the same command runs the setup and each worker in a child process
+        parser.add_argument('--setup', action='store_true', help="(internal) migrate and seed the database")
+        parser.add_argument('--worker', type=int, help="(internal) run as worker number N")
+        parser.add_argument('--start-at', type=float, help="(internal) wall clock time workers start at")
+
+    def handle(self, *args, **options):
+        if options['setup']:
+            return self.setup(options['workers'])
+        if options['worker'] is not None:
+            return self.work(options['worker'], options['takes'], options['start_at'])
+
+        results = {}
+        for profile in options['profiles']:
+            self.stdout.write(f"Running {options['workers']} workers x {options['takes']} takes, {profile} profile...")
+            results[profile] = self.run_profile(profile, options['workers'], options['takes'])
+
+        self.stdout.write(f"\n{'profile':<12}{'takes/s':>10}{'ok':>8}{'failed':>8}{'retries':>9}{'p50 ms':>9}{'p95 ms':>9}")
+        for profile, r in results.items():
+            self.stdout.write(
+                f"{profile:<12}{r['takes_per_second']:>10.1f}{r['ok']:>8}{r['failed']:>8}{r['retries']:>9}"
+                f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'options': {k: options[k] for k in ('workers', 'takes')}, 'results': results}, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def child(self, env, *args, **kwargs):
+        command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_writes', *args]
+        return subprocess.Popen(command, env=env, stdout=subprocess.PIPE, text=True, **kwargs)
+
+    def run_profile(self, profile, workers, takes):
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ,
+                'DJANGO_SQLITE_PROFILE': profile,
+                'DJANGO_SQLITE_PATH': os.path.join(directory, 'bench.sqlite3'),
+            }
+            if self.child(env, '--setup', f'--workers={workers}').wait():
+                raise CommandError("Setting up the benchmark database failed")
+
+            # Workers import Django first, then all start writing at the same moment
+            start_at = time.time() + 3
+            procs = [
+                self.child(env, f'--worker={n}', f'--takes={takes}', f'--start-at={start_at}')
+                for n in range(workers)
+            ]
+            reports = []
+            for proc in procs:
+                out, _ = proc.communicate()
+                if proc.returncode:
+                    raise CommandError(f"Worker exited with {proc.returncode}")
+                reports.append(json.loads(out.strip().splitlines()[-1]))
+
+        latencies = [s for r in reports for s in r['latencies']]
+        elapsed = max(r['finished'] for r in reports) - start_at
+        ok = sum(r['ok'] for r in reports)
+        return {
+            'ok': ok,
+            'failed': sum(r['failed'] for r in reports),
+            'retries': sum(r['retries'] for r in reports),
+            'takes_per_second': round(ok / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        }
+
+    def setup(self, workers):
+        call_command('migrate', verbosity=0)
+        call_command('seed_store', categories=2, subcategories=2, items=5, users=workers, records=2000,
+                     stdout=self.stderr)
+        # Enough stock that no take is refused
+        Item.objects.update(current_stock=10 ** 6, average_stock=10 ** 6)
+
+    def work(self, number, takes, start_at):
+        client = Client()
+        client.force_login(User.objects.filter(is_superuser=False).order_by('id')[number])
+        items = list(Item.objects.values_list('id', flat=True))
+        # Half single takes (write first), half three-item carts (read, then write)
+        requests = [
+            (reverse('take_item', args=[random.choice(items)]), {'quantity': '1'}) if n % 2 else
+            (reverse('take_cart'), {'item': random.sample(items, 3), 'quantity': ['1'] * 3})
+            for n in range(takes)
+        ]
+        time.sleep(max(start_at - time.time(), 0))
+
+        ok = failed = 0
+        latencies = []
+        for url, data in requests:
+            start = time.perf_counter()
+            try:
+                response = client.post(url, data)
+            except OperationalError:
+                # "database is locked": the take was lost
+                failed += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if response.status_code == 302:
+                ok += 1
+            else:
+                failed += 1
+        retries = int(metrics._values[('consumables_db_write_retries_total', ())])
+        self.stdout.write(json.dumps({
+            'ok': ok, 'failed': failed, 'retries': retries, 'latencies': latencies, 'finished': time.time(),
+        }))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from consumables import archive
+
+
+class Command(BaseCommand):
+    help = "Roll consumption records older than the retention window into daily totals and delete them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Days of raw records to keep (default CONSUMPTION_RETENTION_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE, help="Records per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the records that would be archived")
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(options['days'])
+        if options['dry_run']:
+            count = archive.expired(before).count()
+            self.stdout.write(f"{count} records dated before {before} would be archived.")
+            return
+        count = archive.compact(before, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {count} records dated before {before}."))
@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from consumables import export
+
+
+class Command(BaseCommand):
+    help = "Stream the consumption history as CSV or JSONL, optionally gzipped, to a file or stdout"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Gzip the output")
+        parser.add_argument('--start', help="First date to include (YYYY-MM-DD)")
+        parser.add_argument('--end', help="Last date to include (YYYY-MM-DD)")
+        parser.add_argument('--user', help="Only records of this user id")
+        parser.add_argument('--category', help="Only records of items in this category id")
+        parser.add_argument('--output', help="File to write; defaults to stdout")
+
+    def handle(self, *args, **options):
+        try:
+            filters = export.parse_filters(options)
+        except ValueError as e:
+            raise CommandError(f"Invalid filter: {e}")
+
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in export.stream(filters, options['format'], options['gzip']):
+                out.write(chunk)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+        if options['output']:
+            self.stderr.write(f"Exported to {options['output']}")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from consumables import importer
+
+
+class Command(BaseCommand):
+    help = "Create or update categories, subcategories and items from a CSV or JSON file in one transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV (with header row) or JSON file to import")
+        parser.add_argument('--format', choices=('csv', 'json'), help="Defaults to the file extension")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would change")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('json' if path.lower().endswith('.json') else 'csv')
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            report = importer.apply(importer.parse(data, format), dry_run=options['dry_run'])
+        except importer.InvalidImport as e:
+            raise CommandError("\n".join(e.errors))
+
+        for name in report['categories']:
+            self.stdout.write(f"+ category {name}")
+        for name in report['subcategories']:
+            self.stdout.write(f"+ subcategory {name}")
+        if options['verbosity'] > 1:
+            for name in report['created']:
+                self.stdout.write(f"+ {name}")
+            for update in report['updated']:
+                changes = ", ".join(f"{field} {old:g} -> {new:g}" for field, (old, new) in update['changes'].items())
+                self.stdout.write(f"~ {update['name']}: {changes}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Dry run: ' if options['dry_run'] else ''}{len(report['created'])} items created, "
+            f"{len(report['updated'])} updated, {report['unchanged']} unchanged"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from consumables import ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuild the lifetime, per-item and current week credit ledgers from the consumption history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only compare the per-item totals with the history and report mismatches")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = ledger.check()
+            for user_id, item_id, stored, expected in mismatches:
+                self.stdout.write(
+                    f"user {user_id} item {item_id}: stored quantity {stored[0]:g} credits {stored[1]:g}, "
+                    f"history has quantity {expected[0]:g} credits {expected[1]:g}"
+                )
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} item totals disagree with the history; run rebuild_credits.")
+            self.stdout.write(self.style.SUCCESS("Item totals match the consumption history."))
+            return
+        count = ledger.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt credit totals for {count} users."))
@@ -0,0 +1,111 @@
+import random
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from consumables import ledger, versioning
+from consumables.models import Category, SubCategory, Item, ConsumptionRecord
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic store (categories, items, staff and consumption history) for testing and benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=5)
+        parser.add_argument('--subcategories', type=int, default=3, help="Subcategories per category")
+        parser.add_argument('--items', type=int, default=10, help="Items per subcategory (plus as many direct items per category)")
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--records', type=int, default=1000, help="Consumption records to generate")
+        parser.add_argument('--days', type=int, default=90, help="Spread records over this many days up to today")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, so runs are reproducible")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Suffix keeps names unique when seeding into a store that already has data
+        tag = f"{options['seed']}-{Category.objects.count()}"
+
+        categories = Category.objects.bulk_create(
+            Category(name=f"Category {tag}-{c}") for c in range(options['categories'])
+        )
+        subcategories = SubCategory.objects.bulk_create(
+            SubCategory(name=f"Sub {c.id}-{s}", category=c)
+            for c in categories for s in range(options['subcategories'])
+        )
+
+        items = []
+        for sub in subcategories:
+            items.extend(self.make_item(rng, sub.category, sub, f"Item {sub.id}-{i}") for i in range(options['items']))
+        for category in categories:
+            items.extend(self.make_item(rng, category, None, f"Direct {category.id}-{i}") for i in range(options['items']))
+        items = Item.objects.bulk_create(items, batch_size=options['batch_size'])
+
+        users = [
+            User(username=f"staff-{tag}-{u}", first_name=f"Staff {u}", password='!')
+            for u in range(options['users'])
+        ]
+        users = User.objects.bulk_create(users, batch_size=options['batch_size'])
+
+        today = timezone.localtime(timezone.now()).date()
+        tz = timezone.get_current_timezone()
+        batch = []
+        created = 0
+        for _ in range(options['records']):
+            item = rng.choice(items)
+            qty = float(rng.randint(1, 3))
+            day = today - timedelta(days=rng.randrange(max(options['days'], 1)))
+            batch.append(ConsumptionRecord(
+                user=rng.choice(users),
+                item=item,
+                quantity=qty,
+                credits=qty * item.score,
+                date=day,
+            ))
+            if len(batch) >= options['batch_size']:
+                created += self.flush(batch, tz, rng)
+                batch = []
+        if batch:
+            created += self.flush(batch, tz, rng)
+
+        # Usage counts and credit ledgers follow the generated history
+        usage = {}
+        for item_id, qty in ConsumptionRecord.objects.filter(item__in=items).values_list('item_id', 'quantity').iterator():
+            usage[item_id] = usage.get(item_id, 0) + qty
+        for item in items:
+            item.usage_count = usage.get(item.id, 0)
+        Item.objects.bulk_update(items, ['usage_count'], batch_size=options['batch_size'])
+        ledger.rebuild(all_weeks=True)
+        # Bulk writes skip the signals that normally move the store versions
+        versioning.bump(versioning.CATALOGUE, versioning.INVENTORY)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(categories)} categories, {len(subcategories)} subcategories, {len(items)} items, "
+            f"{len(users)} users and {created} consumption records."
+        ))
+
+    def make_item(self, rng, category, subcategory, name):
+        average = float(rng.randint(5, 50))
+        item = Item(
+            category=category,
+            subcategory=subcategory,
+            name=name,
+            average_stock=average,
+            current_stock=float(rng.randint(0, int(average * 1.5))),
+            score=rng.randint(1, 5),
+        )
+        item.update_stock_status()
+        return item
+
+    def flush(self, batch, tz, rng):
+        records = ConsumptionRecord.objects.bulk_create(batch)
+        # auto_now_add stamps "now"; move timestamps onto the generated dates
+        for record in records:
+            record.timestamp = timezone.make_aware(
+                datetime.combine(record.date, time(rng.randrange(8, 20), rng.randrange(60))), tz
+            )
+        ConsumptionRecord.objects.bulk_update(records, ['timestamp'], batch_size=500)
+        return len(records)
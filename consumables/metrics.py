@@ -0,0 +1,205 @@
+"""
+In-process counters exported in Prometheus text format at /metrics.
+
+Increments are plain dict updates, so the hot path takes no lock. When
+settings.METRICS_DIR is set, each worker process periodically (and once more
+at exit) snapshots its counters to <METRICS_DIR>/worker-<pid>-<id>.json and
+the exporter sums every snapshot, so a scrape sees the whole deployment and
+not just the worker that answered it. The random id keeps a reused pid from
+overwriting an older worker's file. Snapshots of workers that have exited are
+folded into retired.json and deleted, so their counts stay in the totals (a
+counter never goes backwards) without a file per worker ever started.
+"""
+import atexit
+import bisect
+import contextlib
+import fcntl
+import glob
+import json
+import os
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+
+# Upper bounds (seconds) of the request latency histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+HELP = {
+    'consumables_requests_total': ('counter', 'Requests handled, by URL name'),
+    'consumables_request_duration_seconds': ('histogram', 'Request latency, by URL name'),
+    'consumables_request_queries_total': ('counter', 'Database queries issued, by URL name'),
+    'consumables_takes_total': ('counter', 'Consumption records created'),
+    'consumables_taken_quantity_total': ('counter', 'Units taken from stock'),
+    'consumables_deletes_total': ('counter', 'Consumption records deleted'),
+    'consumables_db_write_retries_total': ('counter', 'Write views retried after a lock or serialization failure'),
+}
+
+_values = defaultdict(float)
+_last_flush = 0.0
+_worker = f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+
+
+def _forked():
+    # A forked worker starts its own counts under its own name
+    global _worker, _last_flush
+    _values.clear()
+    _last_flush = 0.0
+    _worker = f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+
+
+os.register_at_fork(after_in_child=_forked)
+
+
+def inc(name, labels=(), value=1):
+    _values[(name, labels)] += value
+
+
+def observe_request(view, seconds, queries):
+    labels = (('view', view),)
+    inc('consumables_requests_total', labels)
+    inc('consumables_request_queries_total', labels, queries)
+    inc('consumables_request_duration_seconds_sum', labels, seconds)
+    # Store the single bucket hit; the exporter makes them cumulative
+    le = BUCKETS[bisect.bisect_left(BUCKETS, seconds)]
+    inc('consumables_request_duration_seconds_bucket', labels + (('le', le),))
+    maybe_flush()
+
+
+def _snapshot_path(worker):
+    return os.path.join(settings.METRICS_DIR, f'worker-{worker}.json')
+
+
+def maybe_flush(force=False):
+    """Write this process's counters to the shared directory at most every METRICS_FLUSH_SECONDS."""
+    global _last_flush
+    if not getattr(settings, 'METRICS_DIR', None):
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+        return
+    _last_flush = now
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    _write(_snapshot_path(_worker), list(_values.items()))
+
+
+# The counts since the last periodic flush would be lost otherwise
+atexit.register(maybe_flush, force=True)
+
+
+def _write(path, counters):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump([[name, list(labels), value] for (name, labels), value in counters], f)
+    os.replace(tmp, path)
+
+
+def _read(path, totals):
+    """Add the snapshot at ``path`` to ``totals``; False if it can't be read."""
+    try:
+        with open(path) as f:
+            rows = json.load(f)
+    except (OSError, ValueError):
+        return False
+    for name, labels, value in rows:
+        totals[(name, tuple(tuple(pair) for pair in labels))] += value
+    return True
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # someone else's process
+    return True
+
+
+def _retire(paths):
+    """Fold the snapshots of exited workers into retired.json and delete them."""
+    with open(os.path.join(settings.METRICS_DIR, 'retired.lock'), 'w') as lock:
+        # Under the lock a snapshot is folded once, even with several scrapes at a time
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired_path = os.path.join(settings.METRICS_DIR, 'retired.json')
+        retired = defaultdict(float)
+        _read(retired_path, retired)
+        folded = [path for path in paths if _read(path, retired)]
+        if folded:
+            _write(retired_path, retired.items())
+        for path in folded:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+
+def collect():
+    """Counters summed over this process, every other worker's last snapshot and exited workers."""
+    totals = defaultdict(float, _values)
+    if getattr(settings, 'METRICS_DIR', None):
+        own = _snapshot_path(_worker)
+        dead = []
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, 'worker-*.json')):
+            if path == own:
+                continue
+            if not _alive(int(os.path.basename(path).split('-')[1])):
+                dead.append(path)
+                continue
+            _read(path, totals)
+        if dead:
+            _retire(dead)
+        _read(os.path.join(settings.METRICS_DIR, 'retired.json'), totals)
+    return totals
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        if key == 'le':
+            value = '+Inf' if value == float('inf') else repr(float(value))
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def render(gauges=()):
+    """Prometheus text exposition of all counters plus ``gauges`` [(name, help, value)]."""
+    totals = collect()
+    by_name = defaultdict(list)
+    for (name, labels), value in totals.items():
+        by_name[name].append((labels, value))
+
+    lines = []
+    for family, (kind, text) in HELP.items():
+        lines.append(f'# HELP {family} {text}')
+        lines.append(f'# TYPE {family} {kind}')
+        if kind == 'histogram':
+            lines.extend(_render_histogram(family, by_name))
+        else:
+            for labels, value in sorted(by_name.get(family, [])):
+                lines.append(f'{family}{_format_labels(labels)} {value:g}')
+    for name, text, value in gauges:
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+def _render_histogram(family, by_name):
+    buckets = defaultdict(dict)
+    for labels, value in by_name.get(f'{family}_bucket', []):
+        view = tuple(pair for pair in labels if pair[0] != 'le')
+        le = dict(labels)['le']
+        buckets[view][le] = value
+    sums = dict(by_name.get(f'{family}_sum', []))
+
+    lines = []
+    for view in sorted(buckets):
+        running = 0
+        for le in BUCKETS:
+            running += buckets[view].get(le, 0)
+            lines.append(f'{family}_bucket{_format_labels(view + (("le", le),))} {running:g}')
+        lines.append(f'{family}_sum{_format_labels(view)} {sums.get(view, 0):g}')
+        lines.append(f'{family}_count{_format_labels(view)} {running:g}')
+    return lines
@@ -0,0 +1,191 @@
+import logging
+import mimetypes
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from . import metrics, storage
+from .profiling import QueryTimer, group_queries, track_queries, track_templates
+
+logger = logging.getLogger('consumables.profiling')
+
+
+class RequestProfilingMiddleware:
+    """
+    Opt-in (settings.REQUEST_PROFILING) request timing.
+
+    Adds a Server-Timing header splitting each request into DB, template and
+    view time, and logs the SQL of requests that cross SLOW_REQUEST_QUERIES or
+    SLOW_REQUEST_MS, grouped by normalized statement. Queries run lazily from a
+    template count towards both db and tpl; view is whatever time remains.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.max_queries = getattr(settings, 'SLOW_REQUEST_QUERIES', 50)
+        self.max_ms = getattr(settings, 'SLOW_REQUEST_MS', 500)
+
+    def __call__(self, request):
+        timer = QueryTimer(record=True)
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer), track_templates() as templates:
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = timer.duration * 1000
+        tpl_ms = templates.duration * 1000
+        view_ms = max(total_ms - db_ms - tpl_ms, 0)
+
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{timer.count} queries", '
+            f'tpl;dur={tpl_ms:.1f}, view;dur={view_ms:.1f}, total;dur={total_ms:.1f}'
+        )
+
+        if timer.count > self.max_queries or total_ms > self.max_ms:
+            lines = [f"{count}x {total * 1000:.1f}ms  {sql}" for sql, count, total in group_queries(timer.queries)]
+            logger.warning(
+                "Slow request %s %s: %.1fms, %d queries (%.1fms db)\n%s",
+                request.method, request.path, total_ms, timer.count, db_ms, "\n".join(lines)
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Feeds per-URL-name request counts, latency and query counts to consumables.metrics.
+
+    Sync and async capable, so under ASGI the async views run without a thread hop here.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with track_queries() as timer:
+            response = self.get_response(request)
+        self.observe(request, start, timer)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with track_queries() as timer:
+            response = await self.get_response(request)
+        self.observe(request, start, timer)
+        return response
+
+    def observe(self, request, start, timer):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unmatched'
+        metrics.observe_request(view, time.perf_counter() - start, timer.count)
+
+
+class StaticFilesMiddleware:
+    """
+    Serves STATIC_ROOT when settings.SERVE_STATIC is on (settings_production does that).
+
+    For deployments where no web server sits in front of Django to serve
+    /static/. Files are indexed once at startup, after collectstatic: hashed
+    names from the manifest get a year's Cache-Control with immutable, anything
+    else revalidates. The .br/.gz copies written by PrecompressedManifestStaticFilesStorage
+    are sent to browsers that accept them. Runs ahead of the rest of the stack,
+    so static hits cost no session, user or metrics work.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVE_STATIC', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 60 * 60 * 24 * 365)
+        self.files = self.index(settings.STATIC_ROOT)
+
+    def index(self, root):
+        hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        files = {}
+        for directory, _, names in os.walk(root):
+            for filename in names:
+                if filename.endswith(('.gz', '.br')):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                content_type, _ = mimetypes.guess_type(filename)
+                files[name] = {
+                    'path': path,
+                    'content_type': content_type or 'application/octet-stream',
+                    'immutable': name in hashed,
+                    'variants': [
+                        (encoding, path + suffix) for encoding, suffix in storage.encodings()
+                        if os.path.exists(path + suffix)
+                    ],
+                }
+        return files
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # Static files are small and in the page cache; reading one inline is
+        # cheaper than a thread hop
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        entry = self.files.get(request.path_info[len(self.prefix):])
+        if entry is None:
+            return None
+
+        accepted = {token.split(';')[0].strip() for token in request.headers.get('Accept-Encoding', '').split(',')}
+        path, encoding = entry['path'], None
+        for candidate, variant in entry['variants']:
+            if candidate in accepted:
+                path, encoding = variant, candidate
+                break
+
+        mtime = os.stat(path).st_mtime
+        if entry['immutable']:
+            cache_control = f'public, max-age={self.max_age}, immutable'
+        else:
+            cache_control = 'public, max-age=0, must-revalidate'
+            if not was_modified_since(request.headers.get('If-Modified-Since'), mtime):
+                response = HttpResponseNotModified()
+                response['Cache-Control'] = cache_control
+                return response
+
+        if request.method == 'HEAD':
+            content = b''
+        else:
+            with open(path, 'rb') as f:
+                content = f.read()
+        response = HttpResponse(content, content_type=entry['content_type'])
+        response['Content-Length'] = os.path.getsize(path)
+        response['Last-Modified'] = http_date(mtime)
+        response['Cache-Control'] = cache_control
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if entry['variants']:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+
+
+def backfill_credits(apps, schema_editor):
+    ConsumptionRecord = apps.get_model('consumables', 'ConsumptionRecord')
+    Item = apps.get_model('consumables', 'Item')
+    UserCredit = apps.get_model('consumables', 'UserCredit')
+    score = Subquery(Item.objects.filter(pk=OuterRef('item_id')).values('score')[:1])
+    ConsumptionRecord.objects.update(credits=F('quantity') * score)
+    totals = ConsumptionRecord.objects.values('user_id').annotate(total=Sum('credits'))
+    UserCredit.objects.bulk_create(
+        UserCredit(user_id=row['user_id'], lifetime_credits=row['total']) for row in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consumables', '0006_alter_consumptionrecord_quantity_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consumptionrecord',
+            name='credits',
+            field=models.FloatField(default=0, help_text='Credits earned at the item score in effect when taken'),
+        ),
+        migrations.CreateModel(
+            name='UserCredit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lifetime_credits', models.FloatField(db_index=True, default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='credit', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(backfill_credits, migrations.RunPython.noop),
+    ]
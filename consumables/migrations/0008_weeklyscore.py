@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:13
+
+import django.db.models.deletion
+from django.conf import settings
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_weekly_scores(apps, schema_editor):
+    ConsumptionRecord = apps.get_model('consumables', 'ConsumptionRecord')
+    WeeklyScore = apps.get_model('consumables', 'WeeklyScore')
+    buckets = {}
+    for row in ConsumptionRecord.objects.values('date', 'user_id').annotate(total=Sum('credits')):
+        day = row['date']
+        key = (day - timedelta(days=(day.weekday() - 4) % 7), row['user_id'])
+        buckets[key] = buckets.get(key, 0) + row['total']
+    WeeklyScore.objects.bulk_create(
+        WeeklyScore(week_start=start, user_id=user_id, credits=total)
+        for (start, user_id), total in buckets.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consumables', '0007_consumptionrecord_credits_usercredit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField(help_text='Friday the week starts on')),
+                ('credits', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_scores', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['week_start', '-credits'], name='weekly_score_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('week_start', 'user'), name='unique_weekly_score_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_weekly_scores, migrations.RunPython.noop),
+    ]
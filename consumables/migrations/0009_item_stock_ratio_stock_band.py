@@ -0,0 +1,46 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:24
+
+from django.db import migrations, models
+from django.db.models import Case, F, Value, When
+from django.db.models.lookups import LessThan
+
+
+def backfill_stock_status(apps, schema_editor):
+    Item = apps.get_model('consumables', 'Item')
+    ratio = Case(
+        When(average_stock__gt=0, then=F('current_stock') / F('average_stock')),
+        default=Value(1.0),
+        output_field=models.FloatField()
+    )
+    Item.objects.update(stock_ratio=ratio)
+    Item.objects.update(stock_band=Case(
+        When(LessThan(F('stock_ratio'), 0.25), then=Value(0)),
+        When(LessThan(F('stock_ratio'), 0.5), then=Value(1)),
+        default=Value(2),
+        output_field=models.IntegerField()
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consumables', '0008_weeklyscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='stock_band',
+            field=models.IntegerField(choices=[(0, 'Low'), (1, 'Medium'), (2, 'OK')], default=2, editable=False, help_text='Cached status band of stock_ratio'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='stock_ratio',
+            field=models.FloatField(default=1.0, editable=False, help_text='Cached current/average stock'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('stock_band', 0)), fields=['-usage_count', 'name'], name='item_low_stock_idx'),
+        ),
+        migrations.RunPython(backfill_stock_status, migrations.RunPython.noop),
+    ]
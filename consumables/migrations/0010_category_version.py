@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consumables', '0009_item_stock_ratio_stock_band'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Bumped on any change to the category, its subcategories or items'),
+        ),
+    ]
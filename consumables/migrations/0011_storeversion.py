@@ -0,0 +1,22 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consumables', '0010_category_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('token', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
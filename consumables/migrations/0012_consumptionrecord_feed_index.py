@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consumables', '0011_storeversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consumptionrecord',
+            index=models.Index(fields=['date', 'timestamp', 'id'], name='consumption_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_item_totals(apps, schema_editor):
+    totals = {}
+    for model in ('ConsumptionRecord', 'DailyConsumption'):
+        rows = apps.get_model('consumables', model).objects.values('user_id', 'item_id').annotate(
+            total_quantity=Sum('quantity'), total_credits=Sum('credits'),
+        ).order_by()
+        for row in rows:
+            quantity, credits = totals.get((row['user_id'], row['item_id']), (0, 0))
+            totals[(row['user_id'], row['item_id'])] = (quantity + row['total_quantity'], credits + row['total_credits'])
+    ItemTotal = apps.get_model('consumables', 'ItemTotal')
+    ItemTotal.objects.bulk_create(
+        ItemTotal(user_id=user_id, item_id=item_id, quantity=quantity, credits=credits)
+        for (user_id, item_id), (quantity, credits) in totals.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consumables', '0013_dailyconsumption'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.FloatField(default=0)),
+                ('credits', models.FloatField(default=0, help_text='Credits earned at the item score in effect at each take')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_totals', to='consumables.item')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-quantity'], name='item_total_profile_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'item'), name='unique_item_total_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_item_totals, migrations.RunPython.noop),
+    ]
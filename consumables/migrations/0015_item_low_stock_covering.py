@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consumables', '0014_itemtotal'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='item',
+            name='item_low_stock_idx',
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('stock_band', 0)), fields=['-usage_count', 'name'], include=('id', 'current_stock', 'category'), name='item_low_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+COVERING_INDEX = """
+    DROP INDEX IF EXISTS item_low_stock_idx;
+    CREATE INDEX item_low_stock_idx ON consumables_item (usage_count DESC, name)
+        INCLUDE (id, current_stock, category_id) WHERE stock_band = 0;
+"""
+
+
+def add_covering_index(apps, schema_editor):
+    # The model declares the plain partial index, which is all SQLite can build;
+    # declaring include= there would warn (models.W040) on every SQLite check
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(COVERING_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consumables', '0015_item_low_stock_covering'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='item',
+                    name='item_low_stock_idx',
+                ),
+                migrations.AddIndex(
+                    model_name='item',
+                    index=models.Index(condition=models.Q(('stock_band', 0)), fields=['-usage_count', 'name'], name='item_low_stock_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_covering_index, migrations.RunPython.noop),
+            ],
+        ),
+    ]
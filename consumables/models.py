@@ -1,10 +1,14 @@
 from django.db import models
+from django.db.models import Case, F, Value, When
+from django.db.models.lookups import LessThan
 from django.contrib.auth.models import User
 from django.utils import timezone
+from datetime import timedelta
 
 # Create your models here.
 class Category(models.Model):
     name = models.CharField(max_length=100)
+    version = models.PositiveIntegerField(default=0, editable=False, help_text="Bumped on any change to the category, its subcategories or items")
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -22,6 +26,37 @@ class SubCategory(models.Model):
     def __str__(self):
         return f"{self.category.name} - {self.name}"
 
+class StockBand(models.IntegerChoices):
+    LOW = 0, 'Low'          # under 25% of average, shown red and on the low stock list
+    MEDIUM = 1, 'Medium'    # under 50%, yellow
+    OK = 2, 'OK'            # green
+
+STOCK_BAND_COLORS = {
+    StockBand.LOW: "#ef4444", # Red
+    StockBand.MEDIUM: "#eab308", # Yellow
+    StockBand.OK: "#22c55e", # Green
+}
+
+def stock_status_updates(current=F('current_stock')):
+    """
+    update() kwargs that recompute stock_ratio/stock_band in SQL.
+
+    ``current`` is the expression for the new current_stock, so an F-expression
+    decrement and its status land in the same UPDATE statement.
+    """
+    ratio = Case(
+        When(average_stock__gt=0, then=current / F('average_stock')),
+        default=Value(1.0),
+        output_field=models.FloatField()
+    )
+    band = Case(
+        When(LessThan(ratio, 0.25), then=Value(StockBand.LOW)),
+        When(LessThan(ratio, 0.5), then=Value(StockBand.MEDIUM)),
+        default=Value(StockBand.OK),
+        output_field=models.IntegerField()
+    )
+    return {'stock_ratio': ratio, 'stock_band': band}
+
 class Item(models.Model):
     category = models.ForeignKey(Category, related_name='items', on_delete=models.CASCADE)
     subcategory = models.ForeignKey(SubCategory, related_name='items', on_delete=models.SET_NULL, null=True, blank=True)
@@ -30,6 +65,11 @@ class Item(models.Model):
     current_stock = models.FloatField(default=0)
     usage_count = models.FloatField(default=0, help_text="Cached popularity score (frequency of use)")
     score = models.IntegerField(default=1, help_text="Credits earned per unit taken")
+    stock_ratio = models.FloatField(default=1.0, editable=False, help_text="Cached current/average stock")
+    stock_band = models.IntegerField(choices=StockBand.choices, default=StockBand.OK, editable=False, help_text="Cached status band of stock_ratio")
+
+    # Fields whose change requires stock_ratio/stock_band to be recomputed
+    STOCK_FIELDS = {'current_stock', 'average_stock'}
 
     class Meta:
         constraints = [
@@ -44,34 +84,146 @@ class Item(models.Model):
             )
 
         ]
+        indexes = [
+            # Serves the low stock list (and its ordering) without scanning every item.
+            # On PostgreSQL migration 0016 also INCLUDEs the columns the page shows
+            # (views.low_stock_items); SQLite has no covering indexes
+            models.Index(
+                fields=['-usage_count', 'name'],
+                condition=models.Q(stock_band=StockBand.LOW),
+                name='item_low_stock_idx'
+            ),
+        ]
         ordering = ['-usage_count', 'name']
 
     def __str__(self):
         return self.name
 
-    def stock_percentage(self):
+    def save(self, *args, **kwargs):
+        self.update_stock_status()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.STOCK_FIELDS & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'stock_ratio', 'stock_band'}
+        super().save(*args, **kwargs)
+
+    def update_stock_status(self):
+        """Recompute the cached ratio and band; call before bulk_create/bulk_update."""
         if self.average_stock <= 0:
-            return 100 # Default to full/green if no average set to avoid div/0 error showing red
-        return (self.current_stock / self.average_stock) * 100
+            self.stock_ratio = 1.0 # Default to full/green if no average set to avoid div/0 error showing red
+        else:
+            self.stock_ratio = self.current_stock / self.average_stock
+        if self.stock_ratio < 0.25:
+            self.stock_band = StockBand.LOW
+        elif self.stock_ratio < 0.5:
+            self.stock_band = StockBand.MEDIUM
+        else:
+            self.stock_band = StockBand.OK
+
+    def stock_percentage(self):
+        return self.stock_ratio * 100
 
     def stock_status_color(self):
-        pct = self.stock_percentage()
-        if pct < 25:
-            return "#ef4444" # Red
-        elif pct < 50:
-            return "#eab308" # Yellow
-        else:
-            return "#22c55e" # Green
+        return STOCK_BAND_COLORS[self.stock_band]
 
 class ConsumptionRecord(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     quantity = models.FloatField()
+    credits = models.FloatField(default=0, help_text="Credits earned at the item score in effect when taken")
     date = models.DateField(default=timezone.now)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Newest-first feeds page through this with keyset cursors (see consumables.feeds)
+            models.Index(fields=['date', 'timestamp', 'id'], name='consumption_feed_idx'),
+        ]
+
     def total_credits(self):
-        return self.quantity * self.item.score
+        return self.credits
     
     def __str__(self):
         return f"{self.user.username} - {self.item.name} ({self.quantity})"
+
+class DailyConsumption(models.Model):
+    """
+    Consumption records older than CONSUMPTION_RETENTION_DAYS, rolled up per day,
+    user and item by consumables.archive. Reads that total the history add these
+    to the raw records still in ConsumptionRecord.
+    """
+    date = models.DateField()
+    user = models.ForeignKey(User, related_name='daily_consumption', on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, related_name='daily_consumption', on_delete=models.CASCADE)
+    quantity = models.FloatField(default=0)
+    credits = models.FloatField(default=0)
+    records = models.PositiveIntegerField(default=0, help_text="Raw records rolled into this row")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'user', 'item'], name='unique_daily_consumption_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.user.username} - {self.item.name} ({self.quantity})"
+
+class UserCredit(models.Model):
+    """Running lifetime credit total per user, maintained by consumables.ledger."""
+    user = models.OneToOneField(User, related_name='credit', on_delete=models.CASCADE)
+    lifetime_credits = models.FloatField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.lifetime_credits}"
+
+class ItemTotal(models.Model):
+    """Quantity taken and credits earned per user and item, maintained by consumables.ledger."""
+    user = models.ForeignKey(User, related_name='item_totals', on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, related_name='user_totals', on_delete=models.CASCADE)
+    quantity = models.FloatField(default=0)
+    credits = models.FloatField(default=0, help_text="Credits earned at the item score in effect at each take")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'item'], name='unique_item_total_idx'),
+        ]
+        indexes = [
+            # The profile page reads a user's totals biggest first
+            models.Index(fields=['user', '-quantity'], name='item_total_profile_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.item.name} ({self.quantity})"
+
+def week_start(day):
+    """Friday that opens the Friday-to-Thursday scoring week containing ``day``."""
+    return day - timedelta(days=(day.weekday() - 4) % 7)
+
+class WeeklyScore(models.Model):
+    """Credits earned by a user in one Friday-to-Thursday week, maintained by consumables.ledger."""
+    week_start = models.DateField(help_text="Friday the week starts on")
+    user = models.ForeignKey(User, related_name='weekly_scores', on_delete=models.CASCADE)
+    credits = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['week_start', 'user'], name='unique_weekly_score_idx'),
+        ]
+        indexes = [
+            models.Index(fields=['week_start', '-credits'], name='weekly_score_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.week_start} - {self.user.username} ({self.credits})"
+
+class StoreVersion(models.Model):
+    """
+    Named version token (e.g. 'catalogue') bumped on every change to what it covers.
+
+    Tokens are random rather than counters so a rolled back or restored database
+    can never hand out a value an in-process cache has already seen.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    token = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} - {self.token}"
@@ -0,0 +1,126 @@
+"""
+Timing helpers shared by the bench command and request profiling.
+
+QueryTimer is a connection.execute_wrapper that counts and times SQL.
+track_queries() applies one to every connection used in the current context,
+including the ORM thread that async views reach through sync_to_async.
+track_templates() times template rendering done by the Django template
+backend while it is active. normalize_sql()/group_queries() fold repeated
+statements together so N+1 patterns stand out in logs.
+"""
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.template.backends import django as django_backend
+
+_template_timer = ContextVar('template_timer', default=None)
+_query_timer = ContextVar('query_timer', default=None)
+
+
+class QueryTimer:
+    def __init__(self, record=False):
+        self.count = 0
+        self.duration = 0.0
+        self.record = record
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if self.record:
+                self.queries.append((sql, elapsed))
+
+
+def _tracked_execute(execute, sql, params, many, context):
+    timer = _query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def instrument_connection(connection, **kwargs):
+    """connection_created receiver that lets track_queries() see this connection."""
+    if _tracked_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_tracked_execute)
+
+
+@contextmanager
+def track_queries(record=False):
+    # sync_to_async copies the context into the ORM thread, so the timer follows the request there
+    timer = QueryTimer(record)
+    token = _query_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _query_timer.reset(token)
+
+
+class TemplateTimer:
+    def __init__(self):
+        self.duration = 0.0
+        self.depth = 0
+
+
+def _timed_render(render):
+    def wrapper(self, *args, **kwargs):
+        timer = _template_timer.get()
+        if timer is None:
+            return render(self, *args, **kwargs)
+        # Only the outermost render counts, so includes aren't timed twice
+        timer.depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            timer.depth -= 1
+            if not timer.depth:
+                timer.duration += time.perf_counter() - start
+    wrapper.timed = True
+    return wrapper
+
+
+def instrument_templates():
+    """Wrap the Django template backend once so track_templates() can time it."""
+    if not getattr(django_backend.Template.render, 'timed', False):
+        django_backend.Template.render = _timed_render(django_backend.Template.render)
+
+
+@contextmanager
+def track_templates():
+    instrument_templates()
+    timer = TemplateTimer()
+    token = _template_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _template_timer.reset(token)
+
+
+_SQL_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SQL_IN_LISTS = re.compile(r"\bIN \((?:[^()]+)\)", re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Strip literals so the same statement with different ids groups together."""
+    sql = _SQL_STRINGS.sub('?', sql)
+    sql = _SQL_NUMBERS.sub('?', sql)
+    sql = _SQL_IN_LISTS.sub('IN (...)', sql)
+    return ' '.join(sql.split())
+
+
+def group_queries(queries):
+    """[(normalized sql, count, total seconds)], most repeated first."""
+    groups = {}
+    for sql, elapsed in queries:
+        key = normalize_sql(sql)
+        count, total = groups.get(key, (0, 0.0))
+        groups[key] = (count + 1, total + elapsed)
+    return sorted(((sql, c, t) for sql, (c, t) in groups.items()), key=lambda g: (-g[1], -g[2]))
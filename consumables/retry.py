@@ -0,0 +1,51 @@
+"""
+Retry write views that lost a race for the database.
+
+With several workers on one SQLite file a writer can still time out waiting
+for the lock, and on PostgreSQL a transaction can fail serialization or be
+picked as a deadlock victim. In both cases the whole transaction rolled back,
+so running the view again is safe as long as it does all of its writes in one
+atomic block, which take_item, take_cart, delete_consumption and the stock
+updates do. Attempts back off exponentially with jitter so retrying workers
+don't collide again.
+"""
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+from . import metrics
+
+LOCK_MESSAGES = ('database is locked', 'database table is locked')
+# serialization_failure, deadlock_detected
+RETRY_SQLSTATES = {'40001', '40P01'}
+
+
+def is_retryable(error):
+    cause = error.__cause__
+    sqlstate = getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+    return sqlstate in RETRY_SQLSTATES or any(message in str(error) for message in LOCK_MESSAGES)
+
+
+def backoff(attempt):
+    delay = min(settings.DB_WRITE_RETRY_DELAY * 2 ** attempt, settings.DB_WRITE_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1)
+
+
+def retry_writes(view):
+    """Run ``view`` again, up to DB_WRITE_RETRIES times, when its transaction hits a lock or serialization failure."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        retries = settings.DB_WRITE_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                return view(request, *args, **kwargs)
+            except OperationalError as e:
+                # Inside an outer transaction the failure has already doomed it
+                if attempt == retries or connection.in_atomic_block or not is_retryable(e):
+                    raise
+            metrics.inc('consumables_db_write_retries_total')
+            time.sleep(backoff(attempt))
+    return wrapper
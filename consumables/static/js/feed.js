@@ -0,0 +1,34 @@
+// Infinite scroll for the consumption feeds: when the .feed-more marker comes into
+// view, fetch the next page of rows from its data-next URL and put them in its place.
+(function () {
+    if (!window.IntersectionObserver) return;
+
+    const observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) load(entry.target);
+        });
+    }, { rootMargin: '400px' });
+
+    function load(marker) {
+        observer.unobserve(marker);
+        fetch(marker.dataset.next, { credentials: 'same-origin' })
+            .then(function (response) {
+                if (!response.ok) throw new Error(response.status);
+                return response.text();
+            })
+            .then(function (html) {
+                const rows = document.createRange().createContextualFragment(html);
+                const next = rows.querySelector('.feed-more');
+                marker.replaceWith(rows);
+                if (next) observer.observe(next);
+            })
+            .catch(function () {
+                // Try again the next time the marker scrolls into view
+                observer.observe(marker);
+            });
+    }
+
+    document.querySelectorAll('.feed-more').forEach(function (marker) {
+        observer.observe(marker);
+    });
+})();
@@ -0,0 +1,37 @@
+// Patches stock rows (elements with data-item-id) in place from the live stock stream.
+// Include with data-url pointing at the stock_events URL.
+(function () {
+    const url = document.currentScript.dataset.url;
+    if (!window.EventSource || !url) return;
+
+    function patch(row, delta) {
+        const badge = row.querySelector('.cur-badge');
+        if (badge) {
+            badge.textContent = 'Cur ' + delta.stock;
+            badge.style.color = delta.color;
+        }
+        row.querySelectorAll('input[type="number"]').forEach(function (input) {
+            // Leave inputs alone while someone is typing into them
+            if (document.activeElement === input || input.value !== input.defaultValue) return;
+            input.defaultValue = delta.stock;
+            input.value = delta.stock;
+            if (input.dataset.original !== undefined) input.dataset.original = delta.stock;
+            if (input.style.backgroundColor) {
+                input.style.backgroundColor = delta.color;
+                input.style.borderColor = delta.color;
+            }
+        });
+        if (row.classList.contains('item-card')) {
+            row.style.background = 'linear-gradient(90deg, var(--card-bg) ' + delta.percentage +
+                '%, transparent ' + delta.percentage + '%)';
+        }
+    }
+
+    new EventSource(url).onmessage = function (event) {
+        JSON.parse(event.data).forEach(function (delta) {
+            document.querySelectorAll('[data-item-id="' + delta.id + '"]').forEach(function (row) {
+                patch(row, delta);
+            });
+        });
+    };
+})();
@@ -0,0 +1,63 @@
+"""
+Static files storage for production (settings_production).
+
+ManifestStaticFilesStorage gives every file a content hash in its name
+(css/style.3f2a9c1b7d4e.css), so {% static %} URLs change whenever the file
+does and can be cached for a year. On top of that, collectstatic writes a .gz
+and, when the optional brotli package is installed, a .br copy next to each
+hashed text file; StaticFilesMiddleware (or the web server) sends whichever
+the browser accepts, so nothing is compressed per request.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.txt', '.html', '.map')
+# Below this a compressed copy saves less than the extra headers cost
+MIN_SIZE = 256
+
+
+def encodings():
+    """Precompressed variants written and served, preferred first: (Accept-Encoding token, suffix)."""
+    return ([('br', '.br')] if brotli else []) + [('gzip', '.gz')]
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, mode=brotli.MODE_TEXT)
+    # mtime=0 keeps the output identical between collectstatic runs
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # The manifest maps each file to its final hashed name; CSS passes leave
+        # intermediate hashed copies behind that no page links to
+        for name in set(self.hashed_files.values()):
+            self.precompress(name)
+
+    def precompress(self, name):
+        if not name.endswith(COMPRESSIBLE):
+            return
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < MIN_SIZE:
+            return
+        for encoding, suffix in encodings():
+            compressed = compress(data, encoding)
+            # Only keep variants that are actually smaller
+            if len(compressed) < len(data):
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
@@ -0,0 +1,104 @@
+"""
+Taking stock, shared by the take pages (views.take_item, views.take_cart) and
+the JSON API.
+
+Each take is one transaction: a guarded UPDATE that re-checks stock in the
+database, the consumption records and the ledger. A take the stock doesn't
+allow raises TakeRefused with the message to show; nothing is written. Callers
+run under @retry_writes, which repeats the whole take on a lock error.
+"""
+import operator
+from functools import reduce
+
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Q, When
+from django.utils import timezone
+
+from . import ledger, live, metrics
+from .models import ConsumptionRecord, Item, stock_status_updates
+from .versioning import bump_categories
+
+
+class TakeRefused(Exception):
+    """Not enough stock (or no such item); str() is the message for the user."""
+
+
+def take_item(user, item, qty):
+    """Take ``qty`` of ``item``; returns the ConsumptionRecord."""
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            # PostgreSQL: lock the row first, so concurrent takes of this item queue
+            # here and a refusal below reports the stock that actually stopped it
+            item = Item.objects.select_for_update().get(pk=item.pk)
+        # Guarded decrement: the WHERE clause re-checks stock in the database,
+        # so two kiosks racing for the last units can't lose an update or go negative
+        taken = Item.objects.filter(pk=item.pk, current_stock__gte=qty).update(
+            current_stock=F('current_stock') - qty,
+            usage_count=F('usage_count') + qty,
+            **stock_status_updates(F('current_stock') - qty)
+        )
+        if taken:
+            if not connection.features.has_select_for_update:
+                # ``item`` was read before the transaction; after the UPDATE this one holds
+                # the write lock, so the score read now is the one the take happened at
+                item.score = Item.objects.filter(pk=item.pk).values_list('score', flat=True).get()
+            bump_categories([item.category_id])
+            live.publish([item.id])
+            record = ConsumptionRecord.objects.create(
+                user=user,
+                item=item,
+                quantity=qty,
+                credits=qty * item.score,
+                date=timezone.localtime(timezone.now()).date()
+            )
+            ledger.record_take(record)
+    if not taken:
+        available = item.current_stock
+        item.refresh_from_db(fields=['current_stock'])
+        if available >= qty:
+            raise TakeRefused(f"Someone else just took {item.name}. Only {item.current_stock} available now.")
+        raise TakeRefused(f"Cannot take {qty}! Only {item.current_stock} available.")
+    metrics.inc('consumables_takes_total')
+    metrics.inc('consumables_taken_quantity_total', value=qty)
+    return record
+
+
+def take_cart(user, cart):
+    """Take a whole cart ({item id: qty}) or nothing; returns the ConsumptionRecords."""
+    with transaction.atomic():
+        items = {i.id: i for i in Item.objects.select_for_update().filter(pk__in=cart)}
+        short = [
+            f"{items[i].name} (only {items[i].current_stock})"
+            for i, qty in cart.items() if i in items and items[i].current_stock < qty
+        ]
+        if len(items) != len(cart) or short:
+            raise TakeRefused("Cannot take: " + (", ".join(short) or "some items no longer exist") + ".")
+
+        # One guarded UPDATE for the whole cart; any row failing its check rolls everything back
+        guard = reduce(operator.or_, (Q(pk=i, current_stock__gte=qty) for i, qty in cart.items()))
+        new_stock = Case(*[When(pk=i, then=F('current_stock') - qty) for i, qty in cart.items()], output_field=FloatField())
+        taken = Item.objects.filter(guard).update(
+            current_stock=new_stock,
+            usage_count=Case(*[When(pk=i, then=F('usage_count') + qty) for i, qty in cart.items()], output_field=FloatField()),
+            **stock_status_updates(new_stock)
+        )
+        if taken != len(cart):
+            # Raising out of the atomic block rolls the partial update back
+            raise TakeRefused("Stock changed while taking. Nothing was taken, please try again.")
+        if not connection.features.has_select_for_update:
+            # Without row locks a score edit could have landed since the read above; not after the UPDATE
+            for i, score in Item.objects.filter(pk__in=cart).values_list('id', 'score'):
+                items[i].score = score
+
+        bump_categories(i.category_id for i in items.values())
+        live.publish(cart)
+        local_date = timezone.localtime(timezone.now()).date()
+        records = ConsumptionRecord.objects.bulk_create([
+            ConsumptionRecord(user=user, item=items[i], quantity=qty, credits=qty * items[i].score, date=local_date)
+            for i, qty in cart.items()
+        ])
+        ledger.record_takes(records)
+
+    metrics.inc('consumables_takes_total', value=len(records))
+    metrics.inc('consumables_taken_quantity_total', value=sum(cart.values()))
+    return records
@@ -1,3 +1,1274 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from types import ModuleType
+from unittest.mock import AsyncMock, patch
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.test import (
+    AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, async_views, export, feeds, importer, ledger, live, metrics, retry, takes
+from .auth import CachedModelBackend, cache_key
+from .catalogue import get_catalogue
+from .middleware import StaticFilesMiddleware
+from .models import Category, SubCategory, Item, ConsumptionRecord, DailyConsumption, ItemTotal, StockBand, UserCredit, WeeklyScore, STOCK_BAND_COLORS
+from .urls import build_urlpatterns, urlpatterns
+
+
+class TakeItemTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Oil')
+        self.item = Item.objects.create(category=category, name='5W30', average_stock=10, current_stock=5, score=2)
+
+    def test_take_decrements_stock_and_records_credits(self):
+        self.client.post(reverse('take_item', args=[self.item.id]), {'quantity': '3'})
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, 2)
+        self.assertEqual(self.item.usage_count, 3)
+        record = ConsumptionRecord.objects.get()
+        self.assertEqual(record.credits, 6)
+        self.assertEqual(UserCredit.objects.get(user=self.user).lifetime_credits, 6)
+
+    def test_take_credits_the_score_at_the_time_of_the_take(self):
+        # The view read the item, then an admin changed its score before the take ran
+        Item.objects.filter(pk=self.item.pk).update(score=5)
+        takes.take_item(self.user, self.item, 2)
+        self.assertEqual(ConsumptionRecord.objects.get().credits, 10)
+        self.assertEqual(UserCredit.objects.get(user=self.user).lifetime_credits, 10)
+
+    def test_take_more_than_stock_is_rejected(self):
+        self.client.post(reverse('take_item', args=[self.item.id]), {'quantity': '6'})
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, 5)
+        self.assertFalse(ConsumptionRecord.objects.exists())
+
+    def test_delete_restores_stock_and_credits(self):
+        self.client.post(reverse('take_item', args=[self.item.id]), {'quantity': '2'})
+        record = ConsumptionRecord.objects.get()
+        self.client.get(reverse('delete_consumption', args=[record.id]))
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, 5)
+        self.assertEqual(UserCredit.objects.get(user=self.user).lifetime_credits, 0)
+
+
+    def test_racing_deletes_of_one_record_restore_stock_once(self):
+        self.client.post(reverse('take_item', args=[self.item.id]), {'quantity': '2'})
+        record = ConsumptionRecord.objects.select_related('item').get()
+        url = reverse('delete_consumption', args=[record.id])
+        with patch('consumables.live.publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)
+        publish.assert_called_once_with([self.item.id])
+        # The second delete loaded the record before the first one removed it
+        with patch('consumables.views.get_object_or_404', return_value=record), \
+                patch('consumables.live.publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)
+        publish.assert_not_called()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, 5)
+        self.assertEqual(UserCredit.objects.get(user=self.user).lifetime_credits, 0)
+
+class StockStatusTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Oil')
+        self.item = Item.objects.create(category=category, name='5W30', average_stock=10, current_stock=6)
+
+    def assertBand(self, band, ratio):
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock_band, band)
+        self.assertAlmostEqual(self.item.stock_ratio, ratio)
+
+    def test_band_follows_every_stock_write(self):
+        self.assertBand(StockBand.OK, 0.6)
+        self.client.post(reverse('take_item', args=[self.item.id]), {'quantity': '2'})
+        self.assertBand(StockBand.MEDIUM, 0.4)
+        self.client.post(reverse('take_cart'), {'item': [self.item.id], 'quantity': ['2']})
+        self.assertBand(StockBand.LOW, 0.2)
+        self.assertQuerySetEqual(self.client.get(reverse('low_stock_list')).context['items'], [self.item])
+        record = ConsumptionRecord.objects.latest('id')
+        self.client.get(reverse('delete_consumption', args=[record.id]))
+        self.assertBand(StockBand.MEDIUM, 0.4)
+        self.client.post(reverse('bulk_update_stock'), {f'stock_{self.item.id}': '0'})
+        self.assertBand(StockBand.LOW, 0)
+        self.client.post(reverse('update_stock', args=[self.item.id]), {'current_stock': '9'})
+        self.assertBand(StockBand.OK, 0.9)
+
+    def test_no_average_is_never_low(self):
+        self.item.average_stock = 0
+        self.item.current_stock = 0
+        self.item.save()
+        self.assertBand(StockBand.OK, 1.0)
+
+
+    @skipUnlessDBFeature('supports_covering_indexes')
+    def test_low_stock_index_covers_the_page(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexdef FROM pg_indexes WHERE indexname = 'item_low_stock_idx'")
+            definition, = cursor.fetchone()
+        self.assertIn('INCLUDE (id, current_stock, category_id)', definition)
+        self.assertIn('WHERE (stock_band = 0)', definition)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(self.user)
+        self.oil = Category.objects.create(name='Oil')
+        self.coolant = Category.objects.create(name='Coolant')
+        self.item = Item.objects.create(category=self.oil, name='5W30', average_stock=10, current_stock=6)
+        Item.objects.create(category=self.coolant, name='Blue', average_stock=10, current_stock=6)
+
+    def test_stock_list_serves_unchanged_categories_from_cache(self):
+        self.client.get(reverse('stock_list'))
+        # inventory version, categories; no item query when every fragment is cached
+        with self.assertNumQueries(2):
+            self.client.get(reverse('stock_list'))
+
+    def test_take_invalidates_only_its_category(self):
+        self.client.get(reverse('stock_list'))
+        versions = dict(Category.objects.values_list('id', 'version'))
+        self.client.post(reverse('take_item', args=[self.item.id]), {'quantity': '1'})
+        self.oil.refresh_from_db()
+        self.coolant.refresh_from_db()
+        self.assertEqual(self.oil.version, versions[self.oil.id] + 1)
+        self.assertEqual(self.coolant.version, versions[self.coolant.id])
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('stock_list'))
+        self.assertContains(response, 'Cur 5.0')
+
+
+    def test_stock_changes_keep_the_home_grid_cached(self):
+        self.client.get(reverse('home'))
+        self.client.post(reverse('take_item', args=[self.item.id]), {'quantity': '1'})
+        self.client.post(reverse('bulk_update_stock'), {f'stock_{self.item.id}': '9'})
+        self.client.get(reverse('bulk_update_stock'))  # shows and clears the flash messages
+        # catalogue version for the ETag and for the fragment key; no category query
+        with self.assertNumQueries(2):
+            self.client.get(reverse('home'))
+
+        self.coolant.name = 'Coolants'
+        self.coolant.save()
+        self.assertContains(self.client.get(reverse('home')), 'Coolants')
+
+
+class CatalogueTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Oil')
+        self.item = Item.objects.create(category=self.category, name='5W30', average_stock=10, current_stock=5)
+
+    def test_snapshot_reloads_only_when_catalogue_changes(self):
+        catalogue = get_catalogue()
+        self.assertEqual(catalogue.items[self.item.id].name, '5W30')
+        # Stock writes leave the snapshot alone
+        Item.objects.filter(pk=self.item.pk).update(current_stock=1)
+        self.item.current_stock = 2
+        self.item.save(update_fields=['current_stock'])
+        with self.assertNumQueries(1):
+            self.assertIs(get_catalogue(), catalogue)
+        self.item.name = '10W40'
+        self.item.save()
+        self.assertEqual(get_catalogue().items[self.item.id].name, '10W40')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(self.user)
+        self.oil = Category.objects.create(name='Oil')
+        self.item = Item.objects.create(category=self.oil, name='5W30', average_stock=10, current_stock=6)
+
+    def test_unchanged_stock_list_is_not_modified(self):
+        etag = self.client.get(reverse('stock_list'))['ETag']
+        # inventory version only: session and user come from the cache, no items, no template
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('stock_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_stock_write_changes_every_tag(self):
+        urls = [reverse('stock_list'), reverse('low_stock_list'),
+                reverse('view_category', args=[self.oil.id]), reverse('category_detail', args=[self.oil.id])]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.item.current_stock = 1
+        self.item.save(update_fields=['current_stock'])
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_tag_is_per_user(self):
+        etag = self.client.get(reverse('stock_list'))['ETag']
+        other = Client()
+        other.force_login(User.objects.create_user(username='other', password='pw'))
+        self.assertEqual(other.get(reverse('stock_list'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class LiveStockTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Oil')
+        self.item = Item.objects.create(category=category, name='5W30', average_stock=10, current_stock=6)
+
+    def tearDown(self):
+        live.broadcaster.close()
+
+    def take(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('take_item', args=[self.item.id]), {'quantity': '5'})
+
+    async def assertTakeIsPushed(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(reverse('stock_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        await sync_to_async(self.take)()
+        event = await asyncio.wait_for(anext(stream), 5)
+        self.assertTrue(event.startswith(b'data: '))
+        self.assertEqual(json.loads(event[len(b'data: '):]), [
+            {'id': self.item.id, 'stock': 1.0, 'color': STOCK_BAND_COLORS[StockBand.LOW], 'percentage': 10}
+        ])
+        await stream.aclose()
+
+    async def test_take_is_pushed_to_open_streams(self):
+        await self.assertTakeIsPushed()
+
+    async def test_take_is_pushed_through_worker_sockets(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(LIVE_STOCK_DIR=directory):
+            await self.assertTakeIsPushed()
+
+    def test_queues_of_a_replaced_event_loop_are_dropped(self):
+        async def subscribe():
+            return live.broadcaster.subscribe()
+
+        asyncio.run(subscribe())
+        queue = asyncio.run(subscribe())
+        self.assertEqual(live.broadcaster.subscribers, {queue})
+
+    def test_wsgi_requests_are_told_not_to_reconnect(self):
+        self.assertEqual(self.client.get(reverse('stock_events')).status_code, 204)
+
+
+class AsyncViewsTests(TestCase):
+    """The ASGI read pages, routed the way asgi.py routes them."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='pw', first_name='Sam')
+        self.client.force_login(self.user)
+        self.oil = Category.objects.create(name='Oil')
+        self.item = Item.objects.create(category=self.oil, name='5W30', average_stock=10, current_stock=2, score=3)
+        self.client.post(reverse('take_item', args=[self.item.id]), {'quantity': '1'})
+        self.client.get(reverse('today'))  # consume the flash message
+        self.urlconf = ModuleType('async_urls')
+        self.urlconf.urlpatterns = build_urlpatterns(async_views)
+
+    async def test_read_pages_render_natively(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        pages = {
+            'home': [], 'view_category': [self.oil.id], 'today': [], 'stock_list': [], 'low_stock_list': [],
+            'profile': [], 'leaderboard': [],
+        }
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            subcategory = await SubCategory.objects.acreate(category=self.oil, name='Synthetic')
+            pages['view_subcategory'] = [subcategory.id]
+            for name, args in pages.items():
+                response = await client.get(reverse(name, args=args))
+                self.assertEqual(response.status_code, 200, name)
+                self.assertTrue(iscoroutinefunction(response.resolver_match.func), name)
+            self.assertContains(await client.get(reverse('low_stock_list')), '5W30')
+            self.assertContains(await client.get(reverse('profile')), '3')
+
+    async def test_auth_messages_and_conditional_get_still_apply(self):
+        client = AsyncClient()
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            response = await client.get(reverse('stock_list'))
+            self.assertEqual(response.status_code, 302)
+            await client.aforce_login(self.user)
+            await client.post(reverse('update_stock', args=[self.item.id]), {'current_stock': '4'})
+            response = await client.get(reverse('stock_list'))
+            self.assertContains(response, 'Stock updated for 5W30')
+            etag = (await client.get(reverse('stock_list')))['ETag']
+            response = await client.get(reverse('stock_list'), headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+    async def test_fragment_dropped_between_check_and_render_still_renders(self):
+        # The lookups report every fragment cached while the cache itself is empty, as when
+        # another worker evicts them, or they expire, between the check and render()
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        await cache.aclear()
+        with override_settings(ROOT_URLCONF=self.urlconf), \
+                patch('consumables.async_views.cache') as stale:
+            stale.ahas_key = AsyncMock(return_value=True)
+            stale.aget_many = AsyncMock(side_effect=lambda keys: dict.fromkeys(keys, ''))
+            self.assertContains(await client.get(reverse('view_category', args=[self.oil.id])), '5W30')
+            self.assertContains(await client.get(reverse('stock_list')), '5W30')
+            stale.ahas_key.assert_awaited()
+            stale.aget_many.assert_awaited()
+
+    async def test_metrics_count_queries_made_from_async_views(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        key = ('consumables_request_queries_total', (('view', 'low_stock_list'),))
+        before = metrics.collect()[key]
+        with override_settings(ROOT_URLCONF=self.urlconf):
+            await client.get(reverse('low_stock_list'))
+        # inventory version and items; session and user come from the cache
+        self.assertGreaterEqual(metrics.collect()[key] - before, 2)
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Oil')
+        item = Item.objects.create(category=category, name='5W30', average_stock=10, current_stock=5)
+        today = timezone.localtime(timezone.now()).date()
+        records = ConsumptionRecord.objects.bulk_create(
+            ConsumptionRecord(user=self.user, item=item, quantity=1, date=today - timedelta(days=i % 4))
+            for i in range(feeds.PAGE_SIZE * 2 + 7)
+        )
+        # Shared timestamps, so pages have to fall back on the id to break ties
+        ConsumptionRecord.objects.filter(pk__in=[r.pk for r in records[::2]]).update(timestamp=records[0].timestamp)
+
+    def test_history_pages_cover_every_record_once_in_order(self):
+        response = self.client.get(reverse('history'))
+        ids = [r.id for r in response.context['records']]
+        next_url = response.context['next_url']
+        while next_url:
+            with self.assertNumQueries(1):
+                response = self.client.get(next_url)
+            ids += [r.id for r in response.context['records']]
+            next_url = response.context['next_url']
+        expected = ConsumptionRecord.objects.order_by('-date', '-timestamp', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_today_only_shows_today(self):
+        response = self.client.get(reverse('today'))
+        today = timezone.localtime(timezone.now()).date()
+        self.assertTrue(all(r.date == today for r in response.context['records']))
+        self.assertIsNone(response.context['next_url'])
+
+    def test_bad_cursor_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('history_rows'), {'cursor': 'nonsense'}).status_code, 400)
+
+    def test_undo_is_offered_and_allowed_for_today_only(self):
+        undo = 'class="btn btn-danger"'
+        self.assertContains(self.client.get(reverse('today')), undo)
+        self.assertNotContains(self.client.get(reverse('history')), undo)
+        self.assertNotContains(self.client.get(reverse('history_rows')), undo)
+
+        old = ConsumptionRecord.objects.exclude(date=timezone.localdate()).first()
+        self.client.get(reverse('delete_consumption', args=[old.id]))
+        self.assertTrue(ConsumptionRecord.objects.filter(pk=old.pk).exists())
+        self.assertEqual(Item.objects.get().current_stock, 5)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='pw')
+        self.staff = User.objects.create_user(username='staff', password='pw', first_name='Sam')
+        self.client.force_login(self.admin)
+        oil = Category.objects.create(name='Oil')
+        coolant = Category.objects.create(name='Coolant')
+        self.oil_item = Item.objects.create(category=oil, name='5W30', average_stock=10, current_stock=5, score=2)
+        coolant_item = Item.objects.create(category=coolant, name='Blue', average_stock=10, current_stock=5)
+        ConsumptionRecord.objects.create(user=self.staff, item=self.oil_item, quantity=2, credits=4, date=date(2026, 1, 5))
+        ConsumptionRecord.objects.create(user=self.admin, item=coolant_item, quantity=1, credits=1, date=date(2026, 2, 5))
+
+    def download(self, **params):
+        response = self.client.get(reverse('export_consumption'), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_joins_names_and_applies_filters(self):
+        rows = list(csv.reader(io.StringIO(self.download(category=self.oil_item.category_id).decode())))
+        self.assertEqual(rows[0], list(export.FIELDS))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][3:8], ['staff', 'Sam', 'Oil', '', '5W30'])
+        self.assertEqual(len(list(csv.reader(io.StringIO(self.download(start='2026-02-01').decode())))), 2)
+        self.assertEqual(self.download(format='csv', user=self.admin.id, end='2026-01-31').count(b'\n'), 1)
+
+    def test_gzipped_jsonl_spans_several_chunks(self):
+        with patch.object(export, 'CHUNK_SIZE', 1):
+            lines = gzip.decompress(self.download(format='jsonl', gzip='1')).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([r['item'] for r in records], ['5W30', 'Blue'])
+        self.assertEqual(records[0]['date'], '2026-01-05')
+        self.assertIsNone(records[0]['subcategory'])
+
+    async def test_async_stream_matches_sync_stream(self):
+        sync = await sync_to_async(lambda: b''.join(export.stream({}, 'jsonl')))()
+        chunks = [chunk async for chunk in export.astream({}, 'jsonl')]
+        self.assertEqual(b''.join(chunks), sync)
+
+    def test_bad_filters_and_non_admins_are_refused(self):
+        self.assertEqual(self.client.get(reverse('export_consumption'), {'start': 'soon'}).status_code, 400)
+        self.client.force_login(self.staff)
+        self.assertRedirects(self.client.get(reverse('export_consumption')), reverse('home'))
+
+    def test_command_writes_the_same_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out.csv.gz')
+            call_command('export_consumption', gzip=True, output=path, stderr=StringIO())
+            with gzip.open(path, 'rb') as f:
+                self.assertEqual(f.read(), self.download())
+
+
+class ImportTests(TestCase):
+    CSV = (
+        "category,subcategory,name,average_stock,current_stock,score\n"
+        "Oil,,5W30,10,2,3\n"
+        "Oil,Synthetic,0W20,8,8,1\n"
+        "Filters,,Air,4,1,1\n"
+    )
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='pw')
+        self.client.force_login(self.admin)
+        self.oil = Category.objects.create(name='Oil')
+        self.item = Item.objects.create(category=self.oil, name='5W30', average_stock=10, current_stock=5, score=3)
+
+    def test_upserts_catalogue_in_a_few_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            report = importer.apply(importer.parse(self.CSV))
+        self.assertLessEqual(len(queries), 15)
+        self.assertEqual(report['categories'], ['Filters'])
+        self.assertEqual(report['subcategories'], ['Oil / Synthetic'])
+        self.assertEqual(sorted(report['created']), ['Filters / Air', 'Oil / Synthetic / 0W20'])
+        self.assertEqual(report['updated'], [{'name': 'Oil / 5W30', 'changes': {'current_stock': (5, 2)}}])
+
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.current_stock, self.item.stock_band), (2, StockBand.LOW))
+        self.assertEqual(Item.objects.get(name='0W20').subcategory.name, 'Synthetic')
+        self.assertEqual(Item.objects.get(name='Air').stock_band, StockBand.MEDIUM)
+
+        # Importing the same file again changes nothing and creates no duplicates
+        report = importer.apply(importer.parse(self.CSV))
+        self.assertEqual((report['created'], report['updated'], report['unchanged']), ([], [], 3))
+        self.assertEqual(Item.objects.count(), 3)
+
+    def test_dry_run_reports_without_writing(self):
+        rows = importer.parse(json.dumps([{'category': 'Oil', 'name': '5W30', 'current_stock': 9, 'average_stock': 10,
+                                           'score': 3}, {'category': 'Tyres', 'name': 'R15'}]), 'json')
+        report = importer.apply(rows, dry_run=True)
+        self.assertEqual(report['updated'][0]['changes'], {'current_stock': (5, 9)})
+        self.assertEqual(report['categories'], ['Tyres'])
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, 5)
+        self.assertFalse(Category.objects.filter(name='Tyres').exists())
+
+    def test_bad_rows_are_reported_by_number(self):
+        with self.assertRaises(importer.InvalidImport) as raised:
+            importer.parse("category,name,current_stock\nOil,5W30,lots\n,Air,1\n")
+        self.assertEqual(len(raised.exception.errors), 2)
+        self.assertTrue(raised.exception.errors[0].startswith("Row 1"))
+
+    def test_view_shows_diff_and_command_applies(self):
+        upload = SimpleUploadedFile('stock.csv', self.CSV.encode())
+        response = self.client.post(reverse('import_catalogue'), {'file': upload, 'dry_run': '1'})
+        self.assertContains(response, 'Would change')
+        self.assertContains(response, '+ Filters / Air')
+        self.assertFalse(Item.objects.filter(name='Air').exists())
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.CSV)
+        try:
+            call_command('import_catalogue', f.name, stdout=StringIO())
+        finally:
+            os.unlink(f.name)
+        self.assertTrue(Item.objects.filter(name='Air').exists())
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='viewer', password='pw'))
+        for name, credits in [('ann', 5), ('bob', 9), ('cat', 5), ('dan', 1)]:
+            UserCredit.objects.create(user=User.objects.create_user(username=name), lifetime_credits=credits)
+
+    def ranks(self):
+        board = self.client.get(reverse('leaderboard')).context['lifetime_leaderboard']
+        return [(entry['rank'], entry['score']) for entry in board]
+
+    def test_ties_share_a_rank_with_and_without_window_functions(self):
+        expected = [(1, 9), (2, 5), (2, 5), (4, 1)]
+        self.assertEqual(self.ranks(), expected)
+        with patch.object(connection.features, 'supports_over_clause', False):
+            self.assertEqual(self.ranks(), expected)
+
+
+class WeeklyScoreTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='pw', first_name='Sam')
+        self.client.force_login(self.staff)
+        oil = Category.objects.create(name='Oil')
+        self.item = Item.objects.create(category=oil, name='5W30', average_stock=10, current_stock=50, score=2)
+        self.week = ledger.current_week_start()
+
+    def score(self, start):
+        return WeeklyScore.objects.filter(user=self.staff, week_start=start).values_list('credits', flat=True).first()
+
+    def test_takes_and_deletes_move_the_current_week(self):
+        self.client.post(reverse('take_item', args=[self.item.id]), {'quantity': '3'})
+        self.assertEqual(self.score(self.week), 6)
+        self.client.get(reverse('delete_consumption', args=[ConsumptionRecord.objects.get().id]))
+        self.assertEqual(self.score(self.week), 0)
+
+    def test_completed_weeks_stay_frozen(self):
+        last_week = self.week - timedelta(days=7)
+        record = ConsumptionRecord.objects.create(user=self.staff, item=self.item, quantity=3, credits=6, date=last_week)
+        ledger.record_take(record)
+        self.assertIsNone(self.score(last_week))  # Too late to change that week
+        WeeklyScore.objects.create(user=self.staff, week_start=last_week, credits=6)
+
+        # The undo page refuses last week's records; the ledger still has to cope with other deletes
+        ledger.record_delete(record)
+        record.delete()
+        self.assertEqual(UserCredit.objects.get(user=self.staff).lifetime_credits, 0)
+        self.assertEqual(self.score(last_week), 6)
+        ledger.rebuild()
+        self.assertEqual(self.score(last_week), 6)
+        ledger.rebuild(all_weeks=True)
+        self.assertIsNone(self.score(last_week))
+
+    def test_friday_shows_the_completed_weeks_winner(self):
+        WeeklyScore.objects.create(user=self.staff, week_start=self.week - timedelta(days=7), credits=9)
+        other = User.objects.create_user(username='other')
+        WeeklyScore.objects.create(user=other, week_start=self.week, credits=4)
+        friday = timezone.make_aware(datetime.combine(self.week, time(12)))
+
+        with patch('django.utils.timezone.now', return_value=friday):
+            response = self.client.get(reverse('leaderboard'))
+        self.assertTrue(response.context['is_friday'])
+        self.assertEqual(response.context['start_date'], self.week - timedelta(days=7))
+        self.assertEqual(response.context['weekly_winner'], {'user': self.staff, 'score': 9})
+        self.assertContains(response, 'Sam')
+
+        with patch('django.utils.timezone.now', return_value=friday + timedelta(days=1)):
+            response = self.client.get(reverse('leaderboard'))
+        self.assertFalse(response.context['is_friday'])
+        self.assertEqual(response.context['start_date'], self.week)
+        self.assertEqual(response.context['weekly_winner']['user'], other)
+
+
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='admin', password='pw')
+        self.staff = User.objects.create_user(username='staff', password='pw')
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+        self.client.force_login(self.staff)
+        # The first request of each caches its user
+        self.admin_client.get(reverse('today'))
+        self.client.get(reverse('today'))
+
+    def test_logged_in_request_reads_nothing_before_the_view(self):
+        with self.assertNumQueries(0):
+            response = self.admin_client.get(reverse('add_category'))
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('add_category')).status_code, 200)
+
+    def test_cache_holds_no_password_hash(self):
+        cached = cache.get(cache_key(self.staff.id))
+        self.assertNotIn('password', cached)
+        self.assertNotIn(self.staff.password, cached.values())
+
+        # The cached user still can't blank the real hash when saved
+        user = self.client.get(reverse('today')).wsgi_request.user
+        user.first_name = 'Sam'
+        user.save()
+        self.assertTrue(User.objects.get(pk=self.staff.pk).check_password('pw'))
+
+    def test_edit_staff_drops_the_cached_user(self):
+        self.admin_client.post(reverse('edit_staff', args=[self.staff.id]), {'username': 'staff', 'password': 'new-pw'})
+        # The password change invalidates the staff session, which only shows with a fresh user
+        self.assertRedirects(self.client.get(reverse('today')), f"{reverse('login')}?next={reverse('today')}")
+
+    def test_delete_staff_drops_the_cached_user(self):
+        self.admin_client.get(reverse('delete_staff', args=[self.staff.id]))
+        self.assertRedirects(self.client.get(reverse('today')), f"{reverse('login')}?next={reverse('today')}")
+
+
+class ItemTotalTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(self.staff)
+        oil = Category.objects.create(name='Oil')
+        self.oil = Item.objects.create(category=oil, name='5W30', average_stock=10, current_stock=50, score=2)
+        self.air = Item.objects.create(category=oil, name='Air', average_stock=10, current_stock=50, score=1)
+
+    def totals(self):
+        return {t.item_id: (t.quantity, t.credits) for t in ItemTotal.objects.filter(user=self.staff)}
+
+    def test_takes_and_deletes_keep_totals_at_the_score_of_each_take(self):
+        self.client.post(reverse('take_item', args=[self.oil.id]), {'quantity': '2'})
+        Item.objects.filter(pk=self.oil.pk).update(score=5)
+        self.client.post(reverse('take_cart'), {'item': [self.oil.id, self.air.id], 'quantity': ['1', '3']})
+        self.assertEqual(self.totals(), {self.oil.id: (3, 9), self.air.id: (3, 3)})
+
+        self.client.get(reverse('delete_consumption', args=[ConsumptionRecord.objects.get(item=self.air).id]))
+        self.assertEqual(self.totals()[self.air.id], (0, 0))
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.context['inventory'], [{'name': '5W30', 'quantity': 3, 'credits': 9}])
+        self.assertEqual(response.context['total_credits'], UserCredit.objects.get(user=self.staff).lifetime_credits)
+        self.assertEqual(ledger.check(), [])
+
+    def test_deleting_a_category_takes_its_credits_off_the_ledger(self):
+        tools = Category.objects.create(name='Tools')
+        rag = Item.objects.create(category=tools, name='Rag', average_stock=10, current_stock=50, score=1)
+        self.client.post(reverse('take_cart'), {'item': [self.oil.id, self.air.id, rag.id], 'quantity': ['2', '3', '1']})
+        admin = Client()
+        admin.force_login(User.objects.create_superuser(username='admin', password='pw'))
+        admin.get(reverse('delete_category', args=[self.oil.category_id]))
+
+        self.assertFalse(ItemTotal.objects.filter(item__category_id=self.oil.category_id).exists())
+        self.assertEqual(UserCredit.objects.get(user=self.staff).lifetime_credits, 1)
+        self.assertEqual(WeeklyScore.objects.get(user=self.staff, week_start=ledger.current_week_start()).credits, 1)
+        board = self.client.get(reverse('leaderboard')).context['lifetime_leaderboard']
+        self.assertEqual([(entry['user'], entry['score']) for entry in board], [(self.staff, 1)])
+        self.assertEqual(ledger.check(), [])
+
+        # As the admin deletes: a plain cascade, one item at a time
+        tools.delete()
+        self.assertEqual(UserCredit.objects.get(user=self.staff).lifetime_credits, 0)
+        self.assertEqual(WeeklyScore.objects.get(user=self.staff, week_start=ledger.current_week_start()).credits, 0)
+
+    def test_profile_total_matches_user_credit_after_item_and_category_deletes(self):
+        tools = Category.objects.create(name='Tools')
+        rag = Item.objects.create(category=tools, name='Rag', average_stock=10, current_stock=50, score=4)
+        self.client.post(reverse('take_cart'), {'item': [self.oil.id, self.air.id, rag.id], 'quantity': ['2', '3', '1']})
+        admin = Client()
+        admin.force_login(User.objects.create_superuser(username='admin', password='pw'))
+
+        def profile_total():
+            return self.client.get(reverse('profile')).context['total_credits']
+
+        admin.get(reverse('delete_item', args=[self.air.id]))
+        self.assertEqual(profile_total(), UserCredit.objects.get(user=self.staff).lifetime_credits)
+        self.assertEqual(profile_total(), 8)
+
+        admin.get(reverse('delete_category', args=[self.oil.category_id]))
+        self.assertEqual(profile_total(), UserCredit.objects.get(user=self.staff).lifetime_credits)
+        self.assertEqual(profile_total(), 4)
+
+    def test_check_reports_drift_and_rebuild_repairs_it(self):
+        self.client.post(reverse('take_item', args=[self.oil.id]), {'quantity': '2'})
+        ItemTotal.objects.filter(item=self.oil).update(quantity=7)
+        self.assertEqual(ledger.check(), [(self.staff.id, self.oil.id, (7, 4), (2, 4))])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_credits', check=True, stdout=StringIO())
+        call_command('rebuild_credits', stdout=StringIO())
+        self.assertEqual(self.totals(), {self.oil.id: (2, 4)})
+        call_command('rebuild_credits', check=True, stdout=StringIO())
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(self.staff)
+        oil = Category.objects.create(name='Oil')
+        self.oil = Item.objects.create(category=oil, name='5W30', average_stock=10, current_stock=50, score=2)
+        self.air = Item.objects.create(category=oil, name='Air', average_stock=10, current_stock=50, score=1)
+        today = timezone.localdate()
+        for days, item, quantity in [(200, self.oil, 1), (200, self.oil, 2), (150, self.air, 1.5), (120, self.oil, 1),
+                                     (2, self.oil, 3), (0, self.air, 1)]:
+            record = ConsumptionRecord.objects.create(
+                user=self.staff, item=item, quantity=quantity, credits=quantity * item.score,
+                date=today - timedelta(days=days),
+            )
+            ledger.record_take(record)
+
+    def snapshot(self):
+        response = self.client.get(reverse('profile'))
+        return response.context['inventory'], response.context['total_credits']
+
+    def test_compaction_keeps_profile_and_ledger_totals(self):
+        before = self.snapshot()
+        credits = UserCredit.objects.get(user=self.staff).lifetime_credits
+
+        self.assertEqual(archive.compact(archive.cutoff(90), batch_size=2), 4)
+        self.assertEqual(ConsumptionRecord.objects.count(), 2)
+        day = DailyConsumption.objects.get(item=self.oil, date=timezone.localdate() - timedelta(days=200))
+        self.assertEqual((day.quantity, day.credits, day.records), (3, 6, 2))
+        self.assertEqual(DailyConsumption.objects.count(), 3)
+
+        self.assertEqual(self.snapshot(), before)
+        ledger.rebuild()
+        self.assertEqual(UserCredit.objects.get(user=self.staff).lifetime_credits, credits)
+
+        # Running again, or with a wider window, adds to the existing rollups
+        self.assertEqual(archive.compact(archive.cutoff(90)), 0)
+        call_command('compact_consumption', days=1, stdout=StringIO())
+        self.assertEqual(ConsumptionRecord.objects.count(), 1)
+        self.assertEqual(self.snapshot(), before)
+
+    def test_deleting_an_item_takes_back_archived_credits(self):
+        archive.compact(archive.cutoff(90))
+        self.client.force_login(User.objects.create_superuser(username='admin', password='pw'))
+        self.client.post(reverse('delete_item', args=[self.oil.id]))
+        self.assertFalse(DailyConsumption.objects.filter(item_id=self.oil.id).exists())
+        self.assertEqual(UserCredit.objects.get(user=self.staff).lifetime_credits, 2.5)
+
+
+class TakeCartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Filters')
+        self.a = Item.objects.create(category=category, name='Air', current_stock=4, score=1)
+        self.b = Item.objects.create(category=category, name='Oil', current_stock=2, score=3)
+
+    def test_cart_takes_everything_in_one_transaction(self):
+        self.client.post(reverse('take_cart'), {'item': [self.a.id, self.b.id], 'quantity': ['3', '2']})
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.current_stock, self.b.current_stock), (1, 0))
+        self.assertEqual(ConsumptionRecord.objects.count(), 2)
+        self.assertEqual(UserCredit.objects.get(user=self.user).lifetime_credits, 9)
+
+    def test_malformed_carts_are_refused_with_a_message(self):
+        url = reverse('take_cart')
+        for data in [
+            {'item': [self.a.id, self.b.id], 'quantity': ['1']},
+            {'item': [self.a.id, 'x'], 'quantity': ['1', '1']},
+            {'item': [self.a.id, self.b.id], 'quantity': ['1', 'lots']},
+            {'item': [self.a.id, self.b.id], 'quantity': ['1', '-1']},
+            {'item': [self.a.id], 'quantity': ['nan']},
+        ]:
+            response = self.client.post(url, data, follow=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(list(response.context['messages'])), 1)
+        self.assertFalse(ConsumptionRecord.objects.exists())
+
+        self.assertEqual(self.client.get(url, {'category': 'x'}).status_code, 200)
+        self.assertEqual(self.client.get(url, {'subcategory': '1 OR 1'}).status_code, 200)
+
+    def test_cart_is_all_or_nothing(self):
+        self.client.post(reverse('take_cart'), {'item': [self.a.id, self.b.id], 'quantity': ['1', '5']})
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.current_stock, 4)
+        self.assertFalse(ConsumptionRecord.objects.exists())
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(name='Filters')
+        self.sub = SubCategory.objects.create(category=self.category, name='Cabin')
+        self.a = Item.objects.create(category=self.category, name='Air', current_stock=4, average_stock=4, score=1)
+        self.b = Item.objects.create(category=self.category, subcategory=self.sub, name='Oil', current_stock=2, score=3)
+        self.c = Item.objects.create(category=self.category, name='Fuel', current_stock=0, average_stock=5, score=2)
+
+    def test_anonymous_calls_get_401_not_a_redirect(self):
+        self.client.logout()
+        response = self.client.get(reverse('api_items'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'error': "Authentication required"})
+
+    def test_items_project_fields_and_page_by_cursor(self):
+        url = reverse('api_items')
+        first = self.client.get(url, {'fields': 'name,current_stock', 'limit': 2}).json()
+        self.assertEqual(first['fields'], ['name', 'current_stock'])
+        self.assertEqual(first['rows'], [['Air', 4.0], ['Oil', 2.0]])
+        second = self.client.get(url, {'fields': 'name', 'limit': 2, 'cursor': first['next']}).json()
+        self.assertEqual(second, {'fields': ['name'], 'rows': [['Fuel']], 'next': None})
+        low = self.client.get(url, {'fields': 'id', 'band': 'low'}).json()
+        self.assertEqual(low['rows'], [[self.c.id]])
+        response = self.client.get(url, {'fields': 'name,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_catalogue_tree_and_single_item(self):
+        tree = self.client.get(reverse('api_catalogue'), {'fields': 'name'}).json()
+        self.assertEqual(tree['categories'], [{
+            'id': self.category.id, 'name': 'Filters', 'items': [['Air'], ['Fuel']],
+            'subcategories': [{'id': self.sub.id, 'name': 'Cabin', 'items': [['Oil']]}],
+        }])
+        item = self.client.get(reverse('api_item', args=[self.b.id]), {'fields': 'name,subcategory_id'}).json()
+        self.assertEqual(item, {'name': 'Oil', 'subcategory_id': self.sub.id})
+        self.assertEqual(self.client.get(reverse('api_item', args=[999])).status_code, 404)
+
+    def test_take_single_and_batch_then_list_today(self):
+        url = reverse('api_take')
+        response = self.client.post(url, {'item': self.a.id, 'quantity': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['rows'][0][1:], [self.a.id, 1.0, 1.0])
+        cart = {'items': [{'item': self.a.id, 'quantity': 2}, {'item': self.b.id, 'quantity': 1}]}
+        self.assertEqual(self.client.post(url, cart, content_type='application/json').status_code, 201)
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.current_stock, 1)
+        self.assertEqual(UserCredit.objects.get(user=self.user).lifetime_credits, 6)
+
+        refused = self.client.post(url, {'item': self.c.id, 'quantity': 1}, content_type='application/json')
+        self.assertEqual(refused.status_code, 409)
+        self.assertEqual(self.client.post(url, {'item': self.a.id}, content_type='application/json').status_code, 400)
+
+        today = self.client.get(reverse('api_today'), {'fields': 'item,quantity,user', 'limit': 2}).json()
+        self.assertEqual(len(today['rows']), 2)
+        rest = self.client.get(reverse('api_today'), {'fields': 'item', 'cursor': today['next']}).json()
+        self.assertEqual(len(rest['rows']), 1)
+        self.assertIsNone(rest['next'])
+
+    def test_leaderboard_ranks_ties_in_requested_column_order(self):
+        for name, credits in [('ann', 5), ('bob', 9), ('cat', 5)]:
+            UserCredit.objects.create(user=User.objects.create_user(username=name), lifetime_credits=credits)
+        expected = [['bob', 1], ['ann', 2], ['cat', 2]]
+        url = reverse('api_leaderboard')
+        board = self.client.get(url, {'fields': 'user,rank'}).json()
+        self.assertEqual(sorted(board['rows'], key=lambda row: (row[1], row[0])), expected)
+        with patch.object(connection.features, 'supports_over_clause', False):
+            board = self.client.get(url, {'fields': 'user,rank'}).json()
+        self.assertEqual(sorted(board['rows'], key=lambda row: (row[1], row[0])), expected)
+
+
+class BulkStockCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='manager', password='pw')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Coolant')
+        self.a = Item.objects.create(category=category, name='Blue', current_stock=4)
+        self.b = Item.objects.create(category=category, name='Green', current_stock=2)
+
+    def test_count_updates_only_changed_items(self):
+        response = self.client.post(reverse('bulk_update_stock'), {
+            f'stock_{self.a.id}': '7',
+            f'stock_{self.b.id}': '2',
+        })
+        self.assertRedirects(response, reverse('bulk_update_stock'), fetch_redirect_response=False)
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.current_stock, 7)
+        response = self.client.get(reverse('bulk_update_stock'))
+        self.assertEqual(response.context['changes'], [{'name': 'Blue', 'before': 4, 'after': 7, 'diff': 3}])
+        # Shown once: a refresh goes back to the stock list instead of re-submitting
+        self.assertRedirects(self.client.get(reverse('bulk_update_stock')), reverse('stock_list'))
+
+    def test_malformed_counts_are_reported_and_skipped(self):
+        response = self.client.post(reverse('bulk_update_stock'), {
+            f'stock_{self.a.id}': 'lots',
+            f'stock_{self.b.id}': '-3',
+            'stock_x': '1',
+        }, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['changes'], [])
+        self.assertEqual(response.context['errors'], [
+            'Ignored unknown field stock_x.',
+            'Blue: "lots" is not a valid count, left unchanged.',
+            'Green: "-3" is not a valid count, left unchanged.',
+        ])
+        self.assertEqual(sorted(Item.objects.values_list('current_stock', flat=True)), [2, 4])
+
+    def test_single_item_update_is_one_transaction(self):
+        with patch('consumables.views.live.publish', side_effect=OperationalError("disk I/O error")):
+            with self.assertRaises(OperationalError):
+                self.client.post(reverse('update_stock', args=[self.a.id]), {'current_stock': '9'})
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.current_stock, 4)
+
+        self.client.post(reverse('update_stock', args=[self.a.id]), {'current_stock': '9'})
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.current_stock, 9)
+
+    def test_stock_list_count_mode_renders_single_form(self):
+        response = self.client.get(reverse('stock_list') + '?mode=count')
+        self.assertContains(response, 'id="countForm"')
+        self.assertContains(response, f'name="stock_{self.a.id}"')
+
+
+@override_settings(REQUEST_PROFILING=True, SLOW_REQUEST_QUERIES=0)
+class RequestProfilingTests(TestCase):
+    def test_server_timing_header_and_grouped_slow_log(self):
+        user = User.objects.create_user(username='staff', password='pw')
+        category = Category.objects.create(name='Oil')
+        item = Item.objects.create(category=category, name='5W30', current_stock=5)
+        for _ in range(3):
+            ConsumptionRecord.objects.create(user=user, item=item, quantity=1, date=timezone.localdate())
+        self.client.force_login(user)
+        with self.assertLogs('consumables.profiling', 'WARNING') as logs:
+            response = self.client.get(reverse('today'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertIn('Slow request GET /today/', logs.output[0])
+
+
+class MetricsTests(TestCase):
+    def test_metrics_exposes_request_histogram_and_low_stock_gauge(self):
+        category = Category.objects.create(name='Oil')
+        Item.objects.create(category=category, name='Empty', average_stock=10, current_stock=0)
+        self.client.get(reverse('login'))
+        self.client.force_login(User.objects.create_superuser(username='admin', password='pw'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('consumables_requests_total{view="login"}', body)
+        self.assertIn('consumables_request_duration_seconds_bucket{view="login",le="+Inf"}', body)
+        self.assertIn('consumables_low_stock_items 1', body)
+
+    def test_metrics_need_an_admin_or_the_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.client.force_login(User.objects.create_user(username='staff', password='pw'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer nope'}).status_code, 401)
+            self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer s3cret'}).status_code, 200)
+
+    def test_metrics_sum_snapshots_from_other_workers(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            # The parent process is alive, so its snapshot counts as a running worker
+            with open(os.path.join(directory, f'worker-{os.getppid()}-a1.json'), 'w') as f:
+                json.dump([['consumables_deletes_total', [], 5]], f)
+            before = metrics.collect()[('consumables_deletes_total', ())]
+            metrics.inc('consumables_deletes_total')
+            self.assertEqual(metrics.collect()[('consumables_deletes_total', ())], before + 1)
+            self.assertGreaterEqual(before, 5)
+
+    def test_exited_workers_are_folded_in_once(self):
+        exited = subprocess.Popen([sys.executable, '-c', ''])
+        exited.wait()
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            for worker in ('a1', 'b2'):  # the same pid, reused
+                with open(os.path.join(directory, f'worker-{exited.pid}-{worker}.json'), 'w') as f:
+                    json.dump([['consumables_deletes_total', [], 3]], f)
+            own = metrics.collect()[('consumables_deletes_total', ())] - 6
+            for _ in range(2):
+                self.assertEqual(metrics.collect()[('consumables_deletes_total', ())], own + 6)
+            self.assertEqual(sorted(os.listdir(directory)), ['retired.json', 'retired.lock'])
+
+
+PRODUCTION_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'consumables.storage.PrecompressedManifestStaticFilesStorage'},
+}
+
+
+class StaticAssetsTests(TestCase):
+    def test_pages_link_page_css_instead_of_inlining_it(self):
+        user = User.objects.create_user(username='staff', password='pw')
+        self.client.force_login(user)
+        body = self.client.get(reverse('leaderboard')).content.decode()
+        self.assertNotIn('<style>', body)
+        self.assertIn('css/pages/leaderboard.css', body)
+
+    def test_collectstatic_hashes_and_precompresses(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(STATIC_ROOT=directory, STORAGES=PRODUCTION_STORAGES, SERVE_STATIC=True):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            name = staticfiles_storage.stored_name('css/pages/leaderboard.css')
+            self.assertRegex(name, r'^css/pages/leaderboard\.[0-9a-f]{12}\.css$')
+            with open(os.path.join(directory, name), 'rb') as f, gzip.open(os.path.join(directory, name + '.gz')) as g:
+                original = f.read()
+                self.assertEqual(g.read(), original)
+
+            middleware = StaticFilesMiddleware(lambda request: HttpResponse('view'))
+            factory = RequestFactory()
+            response = middleware(factory.get(f'/static/{name}', HTTP_ACCEPT_ENCODING='gzip, deflate'))
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(gzip.decompress(response.content), original)
+
+            # Unhashed names revalidate; other paths reach the view
+            response = middleware(factory.get('/static/css/pages/leaderboard.css'))
+            self.assertEqual(response['Cache-Control'], 'public, max-age=0, must-revalidate')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            last_modified = response['Last-Modified']
+            request = factory.get('/static/css/pages/leaderboard.css', HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(middleware(request).status_code, 304)
+            self.assertEqual(middleware(factory.get('/static/missing.css')).content, b'view')
+
+
+class ConcurrentTakeTests(TransactionTestCase):
+    """Hammer one item from several threads and check no unit is lost or oversold."""
+
+    threads = 8
+    takes_per_thread = 10
+
+    def setUp(self):
+        category = Category.objects.create(name='Oil')
+        self.item = Item.objects.create(category=category, name='5W30', average_stock=100, current_stock=50)
+        self.users = [User.objects.create_user(username=f'kiosk{i}') for i in range(self.threads)]
+
+    def test_concurrent_takes_never_lose_stock(self):
+        url = reverse('take_item', args=[self.item.id])
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        clients = []
+        for user in self.users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+
+        def worker(client):
+            try:
+                barrier.wait(timeout=10)
+                for _ in range(self.takes_per_thread):
+                    try:
+                        client.post(url, {'quantity': '1'})
+                    except OperationalError:
+                        # SQLite refused the write lock; the transaction rolled back as a whole
+                        pass
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(c,)) for c in clients]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.item.refresh_from_db()
+        taken = ConsumptionRecord.objects.filter(item=self.item).count()
+        self.assertGreater(taken, 0)
+        self.assertGreaterEqual(self.item.current_stock, 0)
+        self.assertEqual(self.item.current_stock, 50 - taken)
+        self.assertEqual(self.item.usage_count, taken)
+
+
+class ConcurrentCompactionTests(TransactionTestCase):
+    """Overlapping compact_consumption runs must roll each record up exactly once."""
+
+    def test_overlapping_runs_count_every_record_once(self):
+        user = User.objects.create_user(username='staff')
+        category = Category.objects.create(name='Oil')
+        items = [Item.objects.create(category=category, name=f'Oil {i}', score=1) for i in range(3)]
+        old = timezone.localdate() - timedelta(days=200)
+        ConsumptionRecord.objects.bulk_create(
+            ConsumptionRecord(user=user, item=items[i % 3], quantity=1, credits=1, date=old - timedelta(days=i % 2))
+            for i in range(120)
+        )
+        barrier = threading.Barrier(4)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait(timeout=10)
+                while True:
+                    try:
+                        if not archive.compact_batch(archive.cutoff(90), batch_size=7):
+                            break
+                    except OperationalError:
+                        # SQLite refused the write lock; the batch rolled back as a whole
+                        pass
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(4)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertFalse(ConsumptionRecord.objects.exists())
+        rollups = DailyConsumption.objects.all()
+        self.assertEqual(len(rollups), 6)
+        self.assertEqual(sum(r.quantity for r in rollups), 120)
+        self.assertEqual(sum(r.records for r in rollups), 120)
+
+
+@override_settings(DB_WRITE_RETRIES=2, DB_WRITE_RETRY_DELAY=0)
+class RetryWritesTests(SimpleTestCase):
+    def flaky_view(self, *errors):
+        calls = []
+
+        @retry.retry_writes
+        def view(request):
+            calls.append(request)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return 'ok'
+        return view, calls
+
+    def test_lock_failures_are_retried_a_bounded_number_of_times(self):
+        locked = OperationalError("database is locked")
+        view, calls = self.flaky_view(locked, locked)
+        self.assertEqual(view('request'), 'ok')
+        self.assertEqual(len(calls), 3)
+
+        view, calls = self.flaky_view(locked, locked, locked)
+        with self.assertRaises(OperationalError):
+            view('request')
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_are_not_retried(self):
+        view, calls = self.flaky_view(OperationalError("no such table: consumables_item"))
+        with self.assertRaises(OperationalError):
+            view('request')
+        self.assertEqual(len(calls), 1)
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def settings_for(self, **env):
+        env = {'DATABASE_ENGINE': 'sqlite', 'DJANGO_SQLITE_PROFILE': 'production', 'DJANGO_ASGI': '0',
+               'DJANGO_ASYNC_VIEWS': '0', **env}
+        with patch.dict(os.environ, env):
+            # By path: re-running the imported module by name makes runpy warn
+            return runpy.run_path(os.path.join(settings.BASE_DIR, 'formula_d_store', 'settings.py'))
+
+    def test_persistent_sqlite_connections_only_under_wsgi(self):
+        self.assertEqual(self.settings_for()['DATABASES']['default']['CONN_MAX_AGE'], 600)
+        self.assertEqual(self.settings_for(DJANGO_ASGI='1')['DATABASES']['default']['CONN_MAX_AGE'], 0)
+        self.assertEqual(self.settings_for(DJANGO_ASYNC_VIEWS='1')['DATABASES']['default']['CONN_MAX_AGE'], 0)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Render every consumables URL against a seeded store and hold each view to a
+    fixed query budget. Budgets must not depend on data size, so each view is
+    checked at two scales and must issue the same number of queries at both.
+    """
+
+    # Queries per view; login_required's session and user lookups are cache hits (cached_db sessions,
+    # consumables.auth), so a read-only page that needs nothing else costs zero
+    budgets = {
+        'home': 3,
+        'login': 0,
+        'logout': 2,
+        'view_category': 4,
+        'view_subcategory': 3,
+        'take_item': 1,
+        'take_cart': 1,
+        'today': 1,
+        'today_rows': 1,
+        'history': 1,
+        'history_rows': 1,
+        'delete_consumption': 10,
+        'stock_list': 3,
+        'stock_events': 0,
+        'low_stock_list': 2,
+        'bulk_update_stock': 0,
+        'update_stock': 1,
+        'manage_categories': 1,
+        'add_category': 0,
+        'category_detail': 4,
+        'edit_category': 1,
+        'delete_category': 16,
+        'add_subcategory': 1,
+        'edit_subcategory': 2,
+        'delete_subcategory': 6,
+        'add_item': 1,
+        'edit_item': 2,
+        'delete_item': 12,
+        'profile': 1,
+        'profile_view': 2,
+        'leaderboard': 2,
+        'manage_staff': 1,
+        'stock_history': 1,
+        'add_staff': 0,
+        'edit_staff': 1,
+        'delete_staff': 10,
+        'export_consumption': 0,
+        'import_catalogue': 0,
+        'metrics': 1,
+        'api_catalogue': 2,
+        'api_items': 1,
+        'api_item': 1,
+        'api_today': 1,
+        'api_take': 11,  # SQLite re-reads the score, PostgreSQL locks the item row first
+        'api_leaderboard': 2,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='pw')
+
+    def setUp(self):
+        # Budgets are for a cold fragment cache
+        cache.clear()
+
+    def seed(self, records, items):
+        call_command('seed_store', categories=3, subcategories=2, items=items, users=5,
+                     records=records, days=14, seed=records, stdout=StringIO())
+
+    def url_kwargs(self):
+        # Latest seeded objects, so the larger run also has the bigger categories
+        item = Item.objects.filter(subcategory__isnull=False).order_by('-id').first()
+        staff = User.objects.filter(is_superuser=False).order_by('-id').first()
+        record = ConsumptionRecord.objects.create(
+            user=self.admin, item=item, quantity=1, credits=item.score,
+            date=timezone.localtime(timezone.now()).date()
+        )
+        ledger.record_take(record)
+        return {
+            'category_id': item.category_id,
+            'subcategory_id': item.subcategory_id,
+            'item_id': item.id,
+            'record_id': record.id,
+            'user_id': staff.id,
+        }
+
+    def measure(self):
+        """Query count per URL name, each request rolled back so destructive GETs don't leak."""
+        counts = {}
+        kwargs = self.url_kwargs()
+        get_catalogue()  # Budgets are for a warm worker; a reload is a constant three queries
+        CachedModelBackend().get_user(self.admin.pk)  # and a cached user, as after the first request
+        for pattern in urlpatterns:
+            params = {k: kwargs[k] for k in pattern.pattern.converters}
+            url = reverse(pattern.name, kwargs=params)
+            self.client.force_login(self.admin)
+            # A flash message left by the previous view would skip the conditional GET lookup
+            self.client.cookies.pop('messages', None)
+            with transaction.atomic():
+                if pattern.name == 'api_take':
+                    # POST only; enough stock that the take goes through
+                    Item.objects.filter(pk=kwargs['item_id']).update(current_stock=10)
+                    take = {'item': kwargs['item_id'], 'quantity': 1}
+                with CaptureQueriesContext(connection) as ctx:
+                    if pattern.name == 'api_take':
+                        response = self.client.post(url, take, content_type='application/json')
+                    else:
+                        response = self.client.get(url)
+                transaction.set_rollback(True)
+            self.assertLess(response.status_code, 400, url)
+            counts[pattern.name] = len(ctx)
+        return counts
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual(set(self.budgets), {p.name for p in urlpatterns})
+
+    def test_query_counts_stay_within_budget_at_any_scale(self):
+        self.seed(records=50, items=2)
+        small = self.measure()
+        self.seed(records=1000, items=8)
+        large = self.measure()
+        for name, budget in self.budgets.items():
+            with self.subTest(view=name):
+                self.assertLessEqual(large[name], budget)
+                self.assertEqual(large[name], small[name], "query count grows with data size")
@@ -1,35 +1,58 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, views
 
-urlpatterns = [
-    path('', views.home, name='home'),
-    path('login/', views.login_view, name='login'),
-    path('logout/', views.logout_view, name='logout'),
-    path('category/<int:category_id>/', views.view_category, name='view_category'),
-    path('subcategory/<int:subcategory_id>/', views.view_subcategory, name='view_subcategory'),
-    path('take/<int:item_id>/', views.take_item, name='take_item'),
-    path('today/', views.today, name='today'),
-    path('consumption/<int:record_id>/delete/', views.delete_consumption, name='delete_consumption'),
-    path('stock/', views.stock_list, name='stock_list'),
-    path('stock/low/', views.low_stock_list, name='low_stock_list'),
-    path('stock/<int:item_id>/update/', views.update_stock, name='update_stock'),
-    path('manage/categories/', views.manage_categories, name='manage_categories'),
-    path('manage/category/add/', views.add_category, name='add_category'),
-    path('manage/category/<int:category_id>/', views.category_detail, name='category_detail'),
-    path('manage/category/<int:category_id>/edit/', views.edit_category, name='edit_category'),
-    path('manage/category/<int:category_id>/delete/', views.delete_category, name='delete_category'),
-    path('manage/category/<int:category_id>/add_subcategory/', views.add_subcategory, name='add_subcategory'),
-    path('manage/subcategory/<int:subcategory_id>/edit/', views.edit_subcategory, name='edit_subcategory'),
-    path('manage/subcategory/<int:subcategory_id>/delete/', views.delete_subcategory, name='delete_subcategory'),
-    path('manage/category/<int:category_id>/add_item/', views.add_item, name='add_item'),
-    path('manage/items/<int:item_id>/edit/', views.edit_item, name='edit_item'),
-    path('manage/items/<int:item_id>/delete/', views.delete_item, name='delete_item'),
-    path('profile/', views.profile, name='profile'),
-    path('profile/<int:user_id>/', views.profile, name='profile_view'),
-    path('leaderboard/', views.leaderboard, name='leaderboard'),
-    path('manage/staff/', views.manage_staff, name='manage_staff'),
-    path('manage/history/', views.stock_history, name='stock_history'),
-    path('manage/staff/add/', views.add_staff, name='add_staff'),
-    path('manage/staff/<int:user_id>/edit/', views.edit_staff, name='edit_staff'),
-    path('manage/staff/<int:user_id>/delete/', views.delete_staff, name='delete_staff'),
-]
\ No newline at end of file
+
+def build_urlpatterns(read_views):
+    """Routes with the read-heavy pages taken from ``read_views`` (views or async_views)."""
+    return [
+        path('', read_views.home, name='home'),
+        path('login/', views.login_view, name='login'),
+        path('logout/', views.logout_view, name='logout'),
+        path('category/<int:category_id>/', read_views.view_category, name='view_category'),
+        path('subcategory/<int:subcategory_id>/', read_views.view_subcategory, name='view_subcategory'),
+        path('take/<int:item_id>/', views.take_item, name='take_item'),
+        path('take/cart/', views.take_cart, name='take_cart'),
+        path('today/', read_views.today, name='today'),
+        path('today/rows/', views.feed_rows, {'feed': 'today'}, name='today_rows'),
+        path('history/', views.history, name='history'),
+        path('history/rows/', views.feed_rows, {'feed': 'history'}, name='history_rows'),
+        path('consumption/<int:record_id>/delete/', views.delete_consumption, name='delete_consumption'),
+        path('stock/', read_views.stock_list, name='stock_list'),
+        path('stock/low/', read_views.low_stock_list, name='low_stock_list'),
+        path('stock/events/', views.stock_events, name='stock_events'),
+        path('stock/count/', views.bulk_update_stock, name='bulk_update_stock'),
+        path('stock/<int:item_id>/update/', views.update_stock, name='update_stock'),
+        path('manage/categories/', views.manage_categories, name='manage_categories'),
+        path('manage/category/add/', views.add_category, name='add_category'),
+        path('manage/category/<int:category_id>/', views.category_detail, name='category_detail'),
+        path('manage/category/<int:category_id>/edit/', views.edit_category, name='edit_category'),
+        path('manage/category/<int:category_id>/delete/', views.delete_category, name='delete_category'),
+        path('manage/category/<int:category_id>/add_subcategory/', views.add_subcategory, name='add_subcategory'),
+        path('manage/subcategory/<int:subcategory_id>/edit/', views.edit_subcategory, name='edit_subcategory'),
+        path('manage/subcategory/<int:subcategory_id>/delete/', views.delete_subcategory, name='delete_subcategory'),
+        path('manage/category/<int:category_id>/add_item/', views.add_item, name='add_item'),
+        path('manage/items/<int:item_id>/edit/', views.edit_item, name='edit_item'),
+        path('manage/items/<int:item_id>/delete/', views.delete_item, name='delete_item'),
+        path('profile/', read_views.profile, name='profile'),
+        path('profile/<int:user_id>/', read_views.profile, name='profile_view'),
+        path('leaderboard/', read_views.leaderboard, name='leaderboard'),
+        path('manage/staff/', views.manage_staff, name='manage_staff'),
+        path('manage/history/', views.stock_history, name='stock_history'),
+        path('manage/staff/add/', views.add_staff, name='add_staff'),
+        path('manage/staff/<int:user_id>/edit/', views.edit_staff, name='edit_staff'),
+        path('manage/staff/<int:user_id>/delete/', views.delete_staff, name='delete_staff'),
+        path('manage/export/', views.export_consumption, name='export_consumption'),
+        path('manage/import/', views.import_catalogue, name='import_catalogue'),
+        path('metrics', views.metrics_view, name='metrics'),
+        path('api/catalogue/', api.catalogue, name='api_catalogue'),
+        path('api/items/', api.items, name='api_items'),
+        path('api/items/<int:item_id>/', api.item, name='api_item'),
+        path('api/today/', api.today, name='api_today'),
+        path('api/take/', api.take, name='api_take'),
+        path('api/leaderboard/', api.leaderboard, name='api_leaderboard'),
+    ]
+
+
+# Native async pages for ASGI deployments (settings.ASYNC_VIEWS); WSGI keeps the sync ones
+urlpatterns = build_urlpatterns(async_views if settings.ASYNC_VIEWS else views)
@@ -0,0 +1,85 @@
+"""
+Version numbers that let caches notice catalogue and stock changes.
+
+Category.version is bumped whenever the category, one of its subcategories or
+one of its items changes, so cache keys that include it go stale on their own.
+The 'catalogue' StoreVersion token changes whenever the structure (categories,
+subcategories, item names and scores) changes, but not for stock movements.
+The 'inventory' token changes on every stock or catalogue write, so whole-store
+pages can be revalidated from that one row.
+
+Model saves and deletes are covered by the signal receivers below; queryset
+update()/bulk_update()/bulk_create() calls skip signals and must call
+bump_categories()/bump() themselves.
+"""
+import random
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Category, SubCategory, Item, StoreVersion
+
+CATALOGUE = 'catalogue'
+INVENTORY = 'inventory'
+
+# Item fields that belong to the catalogue rather than to stock levels
+CATALOGUE_ITEM_FIELDS = {'name', 'score', 'category', 'subcategory'}
+
+
+def bump_categories(category_ids):
+    ids = {i for i in category_ids if i is not None}
+    if ids:
+        Category.objects.filter(pk__in=ids).update(version=F('version') + 1)
+        bump(INVENTORY)
+
+
+def bump(*names):
+    """Give every named version a fresh token, in one UPDATE once the rows exist."""
+    token = random.getrandbits(62)
+    now = timezone.now()
+    updated = StoreVersion.objects.filter(name__in=names).update(token=token, updated=now)
+    if updated < len(names):
+        for name in names:
+            StoreVersion.objects.update_or_create(name=name, defaults={'token': token, 'updated': now})
+
+
+def current(name):
+    """Current token for ``name``, 0 if it has never been bumped."""
+    return StoreVersion.objects.filter(name=name).values_list('token', flat=True).first() or 0
+
+
+async def acurrent(name):
+    return await StoreVersion.objects.filter(name=name).values_list('token', flat=True).afirst() or 0
+
+
+def stamp(name):
+    """(token, last change time) for ``name``; (0, None) if it has never been bumped."""
+    return StoreVersion.objects.filter(name=name).values_list('token', 'updated').first() or (0, None)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        Category.objects.filter(pk=instance.pk).update(version=F('version') + 1)
+    bump(CATALOGUE, INVENTORY)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    bump(CATALOGUE, INVENTORY)
+
+
+@receiver([post_save, post_delete], sender=SubCategory)
+@receiver([post_save, post_delete], sender=Item)
+def category_child_changed(sender, instance, origin=None, update_fields=None, **kwargs):
+    if isinstance(origin, Category):
+        # Cascading from the category itself, which is gone; nothing left to bump
+        return
+    Category.objects.filter(pk=instance.category_id).update(version=F('version') + 1)
+    if sender is Item and update_fields is not None and not CATALOGUE_ITEM_FIELDS & set(update_fields):
+        # Stock-only save
+        bump(INVENTORY)
+    else:
+        bump(CATALOGUE, INVENTORY)
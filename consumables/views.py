@@ -1,13 +1,30 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import AuthenticationForm
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Sum, F, Q
+from django.db import connection, transaction
+from django.db.models import Count, F, Window, prefetch_related_objects
+from django.db.models.functions import Rank
 from django.contrib.auth.models import User
-from .models import Category, SubCategory, Item, ConsumptionRecord
+from .models import Category, SubCategory, Item, ConsumptionRecord, ItemTotal, UserCredit, StockBand, stock_status_updates, week_start
 from django.contrib import messages
+from . import export, feeds, importer, ledger, live, metrics, takes, versioning
+from .retry import retry_writes
+from .versioning import bump_categories
+from .catalogue import get_catalogue, stocked_items
+from .conditional import versioned_page, inventory_version, catalogue_version, category_version, subcategory_version
+from django.utils.functional import SimpleLazyObject
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+import asyncio
+import math
 
 # Authentication
 def login_view(request):
@@ -27,17 +44,25 @@ def logout_view(request):
 
 # Core Navigation
 @login_required
+@versioned_page(catalogue_version)
 def home(request):
-    # Only fetch categories to display main menu
-    categories = Category.objects.all()
-    return render(request, 'consumables/home.html', {'categories': categories})
+    # The grid shows category names only, so it is cached under the catalogue version,
+    # which takes and stock counts leave alone; categories are read only when it is stale
+    categories = SimpleLazyObject(lambda: list(Category.objects.all()))
+    return render(request, 'consumables/home.html', {
+        'categories': categories,
+        'catalogue_version': versioning.current(versioning.CATALOGUE)
+    })
 
 @login_required
+@versioned_page(category_version)
 def view_category(request, category_id):
-    category = get_object_or_404(Category.objects.prefetch_related('items', 'subcategories'), pk=category_id)
-    subcategories = category.subcategories.all()
+    # Tree data stays lazy: it is only read when the cached fragment has gone stale
+    category = get_object_or_404(Category, pk=category_id)
+    catalogue = SimpleLazyObject(get_catalogue)
+    subcategories = SimpleLazyObject(lambda: catalogue.subcategories_of(category.id))
     # Direct items are those without a subcategory
-    direct_items = category.items.filter(subcategory__isnull=True)
+    direct_items = SimpleLazyObject(lambda: stocked_items(catalogue, category_id=category.id, subcategory__isnull=True))
     
     return render(request, 'consumables/view_category.html', {
         'category': category,
@@ -46,15 +71,18 @@ def view_category(request, category_id):
     })
 
 @login_required
+@versioned_page(subcategory_version)
 def view_subcategory(request, subcategory_id):
-    subcategory = get_object_or_404(SubCategory, pk=subcategory_id)
-    items = subcategory.items.all()
+    catalogue = get_catalogue()
+    subcategory = catalogue.subcategory(subcategory_id)
+    items = stocked_items(catalogue, subcategory_id=subcategory.id)
     return render(request, 'consumables/view_subcategory.html', {
         'subcategory': subcategory,
         'items': items
     })
 
 @login_required
+@retry_writes
 def take_item(request, item_id):
     item = get_object_or_404(Item, pk=item_id)
     
@@ -64,19 +92,12 @@ def take_item(request, item_id):
     if request.method == 'POST':
         qty = float(request.POST.get('quantity', 0))
         if qty > 0:
-            if item.current_stock >= qty:
-                item.current_stock -= qty
-                item.usage_count += qty
-                item.save()
-                ConsumptionRecord.objects.create(
-                    user=request.user,
-                    item=item,
-                    quantity=qty,
-                    date=timezone.localtime(timezone.now()).date()
-                )
-                messages.success(request, f"Took {qty} {item.name}")
+            try:
+                takes.take_item(request.user, item, qty)
+            except takes.TakeRefused as e:
+                messages.error(request, str(e))
             else:
-                 messages.error(request, f"Cannot take {qty}! Only {item.current_stock} available.")
+                messages.success(request, f"Took {qty} {item.name}")
         
         # Safe redirect (prevent open redirection vulnerabilities ideally, but keeping simple for now as per internal app)
         return redirect(next_url)
@@ -84,57 +105,196 @@ def take_item(request, item_id):
     # If GET, show confirmation page
     return render(request, 'consumables/take_item.html', {'item': item, 'next_url': next_url})
 
+@login_required
+@retry_writes
+def take_cart(request):
+    """Take several items in one visit: one POST, one transaction, all-or-nothing."""
+    next_url = request.POST.get('next') or request.GET.get('next') or 'home'
+
+    if request.method == 'POST':
+        # Parallel lists of item ids and quantities; repeated ids are merged
+        item_ids, quantities = request.POST.getlist('item'), request.POST.getlist('quantity')
+        if len(item_ids) != len(quantities):
+            messages.error(request, "The cart was incomplete. Nothing was taken, please try again.")
+            return redirect(next_url)
+        cart, bad = {}, []
+        for line, (item_id, qty) in enumerate(zip(item_ids, quantities), 1):
+            try:
+                item_id, qty = int(item_id), float(qty or 0)
+            except ValueError:
+                bad.append(line)
+                continue
+            if not math.isfinite(qty) or qty < 0:
+                bad.append(line)
+            elif qty > 0:
+                cart[item_id] = cart.get(item_id, 0) + qty
+        if bad:
+            messages.error(request, f"Invalid quantity on line {', '.join(map(str, bad))}. Nothing was taken.")
+            return redirect(next_url)
+        if not cart:
+            messages.error(request, "Nothing selected to take.")
+            return redirect(next_url)
+
+        try:
+            records = takes.take_cart(request.user, cart)
+        except takes.TakeRefused as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f"Took {len(records)} items")
+        return redirect(next_url)
+
+    # If GET, show the cart for one subcategory or category
+    # Malformed ids are ignored, like missing ones
+    items = Item.objects.filter(current_stock__gt=0)
+    if request.GET.get('subcategory', '').isdigit():
+        items = items.filter(subcategory_id=request.GET['subcategory'])
+    elif request.GET.get('category', '').isdigit():
+        items = items.filter(category_id=request.GET['category'])
+    return render(request, 'consumables/take_cart.html', {'items': items, 'next_url': next_url})
+
 @login_required
 def today(request):
     # Show ALL records for today? Or just user's?
     # "user will reach into Today section... and can see that day Took element list"
     # "Edit delete option too."
     # "Edit delete option too."
+    records, cursor = feeds.page(today_records(), request.GET.get('cursor'))
+    return render(request, 'consumables/today.html', {'records': records, 'next_url': feed_next_url('today', cursor)})
+
+@login_required
+def history(request):
+    records, cursor = feeds.page(history_records(), request.GET.get('cursor'))
+    return render(request, 'consumables/history.html', {
+        'records': records,
+        'next_url': feed_next_url('history', cursor),
+        'show_date': True
+    })
+
+@login_required
+def feed_rows(request, feed):
+    """Next page of a feed as bare rows, fetched by feed.js for infinite scroll."""
+    records, cursor = feeds.page(FEEDS[feed](), request.GET.get('cursor'))
+    return render(request, 'consumables/feed_rows.html', {
+        'records': records,
+        'next_url': feed_next_url(feed, cursor),
+        'show_date': feed == 'history'
+    })
+
+def today_records():
     local_date = timezone.localtime(timezone.now()).date()
-    records = ConsumptionRecord.objects.filter(date=local_date).order_by('-timestamp')
-    return render(request, 'consumables/today.html', {'records': records})
+    return ConsumptionRecord.objects.filter(date=local_date).select_related('user', 'item')
+
+def history_records():
+    return ConsumptionRecord.objects.select_related('user', 'item')
+
+FEEDS = {'today': today_records, 'history': history_records}
+
+def feed_next_url(feed, cursor):
+    return f"{reverse(f'{feed}_rows')}?cursor={cursor}" if cursor else None
 
 @login_required
+@retry_writes
 def delete_consumption(request, record_id):
-    record = get_object_or_404(ConsumptionRecord, pk=record_id)
-    # Restore stock
-    item = record.item
-    item.current_stock += record.quantity
-    item.save()
-    record.delete()
-    messages.success(request, "Record deleted and stock restored.")
+    record = get_object_or_404(ConsumptionRecord.objects.select_related('item'), pk=record_id)
+    # Undo is for today's mistakes; older takes have long been used and counted
+    if record.date != timezone.localtime(timezone.now()).date():
+        messages.error(request, "Only today's records can be undone.")
+        return redirect('today')
+    with transaction.atomic():
+        # Delete first: of two concurrent deletes of the same record (a double tap, a
+        # retry) only one removes the row, and only that one restores stock and credits
+        deleted, _ = ConsumptionRecord.objects.filter(pk=record.pk).delete()
+        if deleted:
+            restored = F('current_stock') + record.quantity
+            Item.objects.filter(pk=record.item_id).update(current_stock=restored, **stock_status_updates(restored))
+            bump_categories([record.item.category_id])
+            ledger.record_delete(record)
+            live.publish([record.item_id])
+    if deleted:
+        metrics.inc('consumables_deletes_total')
+        messages.success(request, "Record deleted and stock restored.")
+    else:
+        messages.info(request, "Record was already deleted.")
     return redirect('today')
 
 @login_required
+@versioned_page(inventory_version)
 def stock_list(request):
-    categories = Category.objects.prefetch_related('items').all()
-    return render(request, 'consumables/stock_list.html', {'categories': categories})
+    categories = list(Category.objects.all())
+    count_mode = request.GET.get('mode') == 'count'
+    # Only load items for categories whose cached fragment is missing or stale
+    keys = {c.id: make_template_fragment_key('stock_category', [c.id, c.version, count_mode]) for c in categories}
+    cached = cache.get_many(keys.values())
+    prefetch_related_objects([c for c in categories if keys[c.id] not in cached], 'items')
+    return render(request, 'consumables/stock_list.html', {
+        'categories': categories,
+        'count_mode': count_mode
+    })
 
 @login_required
+async def stock_events(request):
+    """Server-Sent Events stream of stock deltas (see consumables.live); needs the ASGI server."""
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be tied up for as long as the kiosk stays open;
+        # 204 tells EventSource not to reconnect
+        return HttpResponse(status=204)
+
+    async def stream():
+        queue = live.broadcaster.subscribe()
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), settings.LIVE_STOCK_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {message}\n\n"
+        finally:
+            live.broadcaster.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def low_stock_queryset():
+    # Stock at 0 or under 25% of a set average; stock_band is kept in sync on every
+    # stock write and served by the partial item_low_stock_idx index
+    return Item.objects.filter(stock_band=StockBand.LOW)
+
+def low_stock_items():
+    # Only the columns the page shows, which item_low_stock_idx also covers on
+    # PostgreSQL, so the item side can be an index-only scan
+    return low_stock_queryset().select_related('category').only(
+        'name', 'current_stock', 'usage_count', 'category__name'
+    ).order_by('-usage_count', 'name')
+
+@login_required
+@versioned_page(inventory_version)
 def low_stock_list(request):
     # Filter for items where stock is 0 or less than 25% of average
     # We must exclude items with 0 average_stock to avoids division issues, 
     # though model defaults to 0. Logic: if average is 0, it's never low stock unless we explicitly want it.
     # But model says if average <= 0 return 100% (Green). So we only care if average > 0.
     
-    low_stock_items = Item.objects.filter(
-        average_stock__gt=0
-    ).filter(
-        Q(current_stock__lte=0) | 
-        Q(current_stock__lt=F('average_stock') * 0.25)
-    ).order_by('-usage_count', 'name')
+    items = low_stock_items()
     
-    return render(request, 'consumables/low_stock_list.html', {'items': low_stock_items})
+    return render(request, 'consumables/low_stock_list.html', {'items': items})
 
 @login_required
+@retry_writes
 def update_stock(request, item_id):
     item = get_object_or_404(Item, pk=item_id)
     if request.method == 'POST':
         new_stock = request.POST.get('current_stock')
         if new_stock is not None:
             # Handle empty string as 0
-            item.current_stock = float(new_stock or 0)
-            item.save()
+            with transaction.atomic():
+                item.current_stock = float(new_stock or 0)
+                item.save(update_fields=['current_stock'])
+                live.publish([item.id])
             messages.success(request, f"Stock updated for {item.name}")
     
     # Smart Redirection
@@ -144,12 +304,70 @@ def update_stock(request, item_id):
         
     return redirect('stock_list')
 
+@login_required
+@retry_writes
+def bulk_update_stock(request):
+    """Apply a whole stock count (stock_<item_id> fields) in one POST and show what changed."""
+    if request.method != 'POST':
+        # POST/redirect/GET: the summary is shown once, so a refresh can't re-submit the count
+        summary = request.session.pop('stock_count_summary', None)
+        if summary is None:
+            return redirect('stock_list')
+        return render(request, 'consumables/stock_count_summary.html', summary)
+
+    counts, invalid, errors = {}, {}, []
+    for key, value in request.POST.items():
+        if not key.startswith('stock_'):
+            continue
+        if not key[len('stock_'):].isdigit():
+            errors.append(f"Ignored unknown field {key}.")
+            continue
+        item_id = int(key[len('stock_'):])
+        try:
+            count = float(value or 0)
+        except ValueError:
+            count = None
+        if count is None or not math.isfinite(count) or count < 0:
+            invalid[item_id] = value
+        else:
+            counts[item_id] = count
+
+    changes = []
+    with transaction.atomic():
+        items = Item.objects.select_for_update().filter(pk__in=counts).order_by('name')
+        changed = []
+        for item in items:
+            new_stock = counts[item.id]
+            if new_stock != item.current_stock:
+                changes.append({
+                    'name': item.name,
+                    'before': item.current_stock,
+                    'after': new_stock,
+                    'diff': new_stock - item.current_stock
+                })
+                item.current_stock = new_stock
+                item.update_stock_status()
+                changed.append(item)
+        Item.objects.bulk_update(changed, ['current_stock', 'stock_ratio', 'stock_band'])
+        bump_categories(item.category_id for item in changed)
+        live.publish(item.id for item in changed)
+
+    if invalid:
+        names = dict(Item.objects.filter(pk__in=invalid).values_list('id', 'name'))
+        errors += [
+            f"{names.get(item_id, f'Item {item_id}')}: \"{value}\" is not a valid count, left unchanged."
+            for item_id, value in invalid.items()
+        ]
+    messages.success(request, f"Stock count saved: {len(changes)} items updated.")
+    request.session['stock_count_summary'] = {'changes': changes, 'errors': errors}
+    return redirect('bulk_update_stock')
+
 # Management
 @login_required
 # Manage Categories
 @login_required
 def manage_categories(request):
-    categories = Category.objects.all()
+    categories = Category.objects.annotate(item_count=Count('items'))
     return render(request, 'consumables/manage_categories.html', {'categories': categories})
 
 @login_required
@@ -183,15 +401,33 @@ def delete_category(request, category_id):
         return redirect('manage_categories')
     category = get_object_or_404(Category, pk=category_id)
     name = category.name
-    category.delete()
+    # The delete cascades to the items; take all their credits back in one pass
+    with transaction.atomic(), ledger.forgetting(category.items.all()):
+        category.delete()
     messages.success(request, f"Category '{name}' deleted.")
     return redirect('manage_categories')
 
 
 @login_required
+@versioned_page(category_version)
 def category_detail(request, category_id):
-    category = get_object_or_404(Category.objects.prefetch_related('items', 'subcategories', 'subcategories__items'), pk=category_id)
-    return render(request, 'consumables/category_detail.html', {'category': category})
+    category = get_object_or_404(Category, pk=category_id)
+
+    def tree():
+        # Only runs when the cached fragment is stale: names from the catalogue, stock read fresh
+        catalogue = get_catalogue()
+        items = stocked_items(catalogue, category_id=category.id)
+        direct_items = [i for i in items if i.subcategory_id is None]
+        subcategories = [
+            (sub, [i for i in items if i.subcategory_id == sub.id])
+            for sub in catalogue.subcategories_of(category.id)
+        ]
+        return {'direct_items': direct_items, 'subcategories': subcategories}
+
+    return render(request, 'consumables/category_detail.html', {
+        'category': category,
+        'tree': SimpleLazyObject(tree)
+    })
 
 @login_required
 def add_subcategory(request, category_id):
@@ -232,8 +468,9 @@ def delete_subcategory(request, subcategory_id):
 
 @login_required
 def add_item(request, category_id):
-    category = get_object_or_404(Category, pk=category_id)
-    subcategories = category.subcategories.all()
+    catalogue = get_catalogue()
+    category = catalogue.category(category_id)
+    subcategories = catalogue.subcategories_of(category.id)
     
     if request.method == 'POST':
         name = request.POST.get('name')
@@ -247,7 +484,7 @@ def add_item(request, category_id):
             subcategory = get_object_or_404(SubCategory, pk=subcategory_id)
 
         Item.objects.create(
-            category=category,
+            category_id=category.id,
             subcategory=subcategory,
             name=name,
             average_stock=avg_stock,
@@ -260,7 +497,7 @@ def add_item(request, category_id):
 @login_required
 def edit_item(request, item_id):
     item = get_object_or_404(Item, pk=item_id)
-    subcategories = item.category.subcategories.all()
+    subcategories = get_catalogue().subcategories_of(item.category_id)
     
     if request.method == 'POST':
         item.name = request.POST.get('name')
@@ -274,7 +511,8 @@ def edit_item(request, item_id):
             item.subcategory = get_object_or_404(SubCategory, pk=subcategory_id)
             
         item.save()
-        return redirect('category_detail', category_id=item.category.id)
+        live.publish([item.id])
+        return redirect('category_detail', category_id=item.category_id)
     return render(request, 'consumables/edit_item.html', {'item': item, 'subcategories': subcategories})
 
 @login_required
@@ -282,7 +520,7 @@ def delete_item(request, item_id):
     # User requested all users can delete items
     item = get_object_or_404(Item, pk=item_id)
     cat_id = item.category.id
-    item.delete()
+    item.delete()  # ledger.item_deleted takes the item's credits back in the same transaction
     messages.success(request, "Item deleted.")
     return redirect('category_detail', category_id=cat_id)
 
@@ -295,76 +533,42 @@ def profile(request, user_id=None):
     else:
         profile_user = request.user
         
-    # Aggregate records by item
-    # We group by Item and sum Quantity.
-    aggr_records = ConsumptionRecord.objects.filter(user=profile_user).values(
-        'item__name', 'item__score'
-    ).annotate(
-        total_qty=Sum('quantity')
-    ).order_by('-total_qty')
-    
-    # Calculate total credits and prepare list
-    inventory_list = []
-    total_credits = 0
-    
-    for entry in aggr_records:
-        qty = entry['total_qty']
-        score = entry['item__score']
-        credits = qty * score
-        total_credits += credits
-        
-        inventory_list.append({
-            'name': entry['item__name'],
-            'quantity': qty,
-            'credits': credits
-        })
-    
+    inventory_list, total_credits = profile_inventory(profile_records(profile_user))
     return render(request, 'consumables/profile.html', {
         'inventory': inventory_list,
         'total_credits': total_credits,
         'profile_user': profile_user
     })
 
+def profile_records(profile_user):
+    # Per-item totals maintained by ledger: one indexed read, biggest first.
+    # Credits are what each take earned at the score in effect at the time.
+    return ItemTotal.objects.filter(user=profile_user, quantity__gt=0).values(
+        'item__name', 'quantity', 'credits'
+    ).order_by('-quantity')
+
+def profile_inventory(totals):
+    # Prepare list and total credits
+    inventory_list = [
+        {'name': entry['item__name'], 'quantity': entry['quantity'], 'credits': entry['credits']}
+        for entry in totals
+    ]
+    return inventory_list, sum(entry['credits'] for entry in inventory_list)
+
 @login_required
 def leaderboard(request):
-    users = User.objects.all()
-    
-    # 1. Lifetime Leaderboard
-    lifetime_data = []
-    for u in users:
-        records = ConsumptionRecord.objects.filter(user=u)
-        score = sum(r.total_credits() for r in records)
-        if score > 0:
-            lifetime_data.append({'user': u, 'score': score})
-    lifetime_data.sort(key=lambda x: x['score'], reverse=True)
+    # 1. Lifetime Leaderboard (running totals maintained by ledger)
+    lifetime_data = lifetime_leaderboard(lifetime_credits())
     
     # 2. Weekly Winner / Leader Logic
     today = timezone.localtime(timezone.now()).date()
-    
-    if today.weekday() == 4:
-        # It's Friday! Show the COMPLETED week's winner (Last Fri - Thu)
-        # matches Home Page Banner logic
-        start_date = today - timedelta(days=7)
-        end_date = today - timedelta(days=1)
-        weekly_records = ConsumptionRecord.objects.filter(date__range=[start_date, end_date])
-    else:
-        # Saturday-Thursday: Show CURRENT week race (Start from most recent Friday)
-        days_since_friday = (today.weekday() - 4) % 7
-        start_date = today - timedelta(days=days_since_friday)
-        weekly_records = ConsumptionRecord.objects.filter(date__gte=start_date)
-
-    # Calculate weekly scores
-    weekly_scores = {}
-    for r in weekly_records:
-        if r.user not in weekly_scores:
-            weekly_scores[r.user] = 0
-        weekly_scores[r.user] += r.total_credits()
-    
-    # Find max score
+    start_date = leaderboard_week(today)
+
+    # Weekly buckets are maintained by ledger; one indexed read for the leader
     weekly_winner = None
-    if weekly_scores:
-        winner_user = max(weekly_scores, key=weekly_scores.get)
-        weekly_winner = {'user': winner_user, 'score': weekly_scores[winner_user]}
+    leader = ledger.weekly_leader(start_date)
+    if leader:
+        weekly_winner = {'user': leader.user, 'score': leader.credits}
         
     is_friday = (today.weekday() == 4)
     
@@ -375,6 +579,32 @@ def leaderboard(request):
         'start_date': start_date
     })
 
+def lifetime_credits():
+    credits = UserCredit.objects.filter(lifetime_credits__gt=0).select_related('user').order_by('-lifetime_credits')
+    if connection.features.supports_over_clause:
+        # Ties share a rank, computed by the database in the same pass
+        credits = credits.annotate(rank=Window(Rank(), order_by=F('lifetime_credits').desc()))
+    return credits
+
+def lifetime_leaderboard(credits):
+    rows = []
+    for c in credits:
+        rank = getattr(c, 'rank', None)
+        if rank is None:
+            # No window functions: same competition ranking, counted here
+            tied = rows and rows[-1]['score'] == c.lifetime_credits
+            rank = rows[-1]['rank'] if tied else len(rows) + 1
+        rows.append({'user': c.user, 'score': c.lifetime_credits, 'rank': rank})
+    return rows
+
+def leaderboard_week(today):
+    if today.weekday() == 4:
+        # It's Friday! Show the COMPLETED week's winner (Last Fri - Thu)
+        # matches Home Page Banner logic
+        return today - timedelta(days=7)
+    # Saturday-Thursday: Show CURRENT week race (Start from most recent Friday)
+    return week_start(today)
+
 # Staff Management
 @login_required
 def manage_staff(request):
@@ -447,3 +677,63 @@ def stock_history(request):
     items = Item.objects.filter(usage_count__gt=0).order_by('-usage_count')
     
     return render(request, 'consumables/stock_history.html', {'items': items})
+
+@login_required
+def export_consumption(request):
+    """Stream the consumption history as CSV or JSONL (?format=, ?gzip=1, ?start=, ?end=, ?user=, ?category=)."""
+    if not request.user.is_superuser:
+        messages.error(request, "Access denied.")
+        return redirect('home')
+
+    format = request.GET.get('format', 'csv')
+    compress = request.GET.get('gzip') == '1'
+    try:
+        filters = export.parse_filters(request.GET)
+    except ValueError:
+        return HttpResponse("Invalid export filters.", status=400)
+    if format not in export.FORMATS:
+        return HttpResponse("Unknown export format.", status=400)
+
+    # Under ASGI a sync iterator would be read whole into memory before sending
+    chunks = export.astream if isinstance(request, ASGIRequest) else export.stream
+    content_type = 'application/gzip' if compress else ('text/csv' if format == 'csv' else 'application/x-ndjson')
+    response = StreamingHttpResponse(chunks(filters, format, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export.filename(format, compress)}"'
+    return response
+
+@login_required
+def import_catalogue(request):
+    """Upsert categories, subcategories and items from an uploaded CSV or JSON file; dry runs only show the diff."""
+    if not request.user.is_superuser:
+        messages.error(request, "Access denied.")
+        return redirect('home')
+
+    context = {'columns': importer.COLUMNS}
+    upload = request.FILES.get('file')
+    if request.method == 'POST' and upload:
+        dry_run = request.POST.get('dry_run') == '1'
+        format = 'json' if upload.name.lower().endswith('.json') else 'csv'
+        try:
+            report = importer.apply(importer.parse(upload.read(), format), dry_run=dry_run)
+        except importer.InvalidImport as e:
+            context['errors'] = e.errors
+        else:
+            context.update(report=report, dry_run=dry_run)
+            if not dry_run:
+                messages.success(
+                    request,
+                    f"Import done: {len(report['created'])} items created, {len(report['updated'])} updated."
+                )
+    return render(request, 'consumables/import_catalogue.html', context)
+
+# Monitoring
+def metrics_view(request):
+    # Admins, or Prometheus with settings.METRICS_TOKEN; not worth a login redirect for a scraper
+    token = settings.METRICS_TOKEN
+    bearer = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not request.user.is_superuser and not (token and constant_time_compare(bearer, token)):
+        return HttpResponse("Metrics need an admin login or the metrics token.", status=401)
+    gauges = [
+        ('consumables_low_stock_items', 'Items currently on the low stock list', low_stock_queryset().count()),
+    ]
+    return HttpResponse(metrics.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
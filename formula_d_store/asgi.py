@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'formula_d_store.settings')
+# Route the read-heavy pages to consumables.async_views (see settings.ASYNC_VIEWS)
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', '1')
+# Persistent database connections stay off under ASGI (see settings.DATABASES)
+os.environ.setdefault('DJANGO_ASGI', '1')
 
 application = get_asgi_application()
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 
+from decouple import config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'consumables.middleware.MetricsMiddleware', # Outermost, so latency covers the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'consumables.middleware.RequestProfilingMiddleware', # Opt-in, see REQUEST_PROFILING
 ]
 
 ROOT_URLCONF = 'formula_d_store.urls'
@@ -74,13 +78,108 @@ WSGI_APPLICATION = 'formula_d_store.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
+# Configured from the environment or a .env file (python-decouple).
+# DATABASE_ENGINE=postgresql selects PostgreSQL with a psycopg connection pool;
+# anything else keeps the SQLite file.
+DATABASE_ENGINE = config('DATABASE_ENGINE', default='sqlite')
+
+# SQLITE_PROFILE 'production' (the default) sets SQLite up for several workers
+# writing at once: WAL so readers never wait for the writer, IMMEDIATE
+# transactions so a writer queues on the busy timeout up front instead of
+# failing when a read lock can't be upgraded, and persistent connections
+# (WSGI only).
+# 'basic' is Django's stock setup, kept for comparison (see bench_writes).
+SQLITE_PROFILE = config('DJANGO_SQLITE_PROFILE', default='production')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',      # durable across crashes in WAL mode; only a power cut can lose the last commits
+    'mmap_size': 256 * 1024 ** 2,
+    'cache_size': -32000,         # KiB, i.e. 32 MB of page cache per connection
+    'temp_store': 'MEMORY',
+}
+
+# Serve the read-heavy pages with their native async versions (consumables.async_views).
+# asgi.py turns this on; WSGI workers keep the sync views and skip an event loop per request.
+ASYNC_VIEWS = config('DJANGO_ASYNC_VIEWS', default=False, cast=bool)
+# Set by asgi.py: the process serves ASGI, whichever views it routes to
+ASGI = config('DJANGO_ASGI', default=False, cast=bool)
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DATABASE_NAME', default='formula_stock'),
+            'USER': config('DATABASE_USER', default='postgres'),
+            'PASSWORD': config('DATABASE_PASSWORD', default=''),
+            'HOST': config('DATABASE_HOST', default='localhost'),  # or the directory of a Unix socket
+            'PORT': config('DATABASE_PORT', default='5432'),
+            'OPTIONS': {
+                # Pooled connections are handed back at the end of each request
+                # (CONN_MAX_AGE must stay 0 with a pool)
+                'pool': {
+                    'min_size': config('DATABASE_POOL_MIN_SIZE', default=2, cast=int),
+                    'max_size': config('DATABASE_POOL_MAX_SIZE', default=10, cast=int),
+                    'timeout': config('DATABASE_POOL_TIMEOUT', default=10, cast=int),
+                },
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DJANGO_SQLITE_PATH', default=BASE_DIR / 'db.sqlite3'),
+        }
+    }
+    if SQLITE_PROFILE == 'production':
+        DATABASES['default'].update({
+            # Persistent connections only under WSGI, where each worker thread is long-lived.
+            # Under ASGI sync code runs in short-lived executor threads, and every one would
+            # keep its own connection open; Django advises CONN_MAX_AGE=0 there
+            'CONN_MAX_AGE': 0 if ASGI or ASYNC_VIEWS else 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': 20,  # seconds a writer waits for the lock
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            },
+        })
+
+# Write views retry a transaction that lost the write lock (or, on other databases,
+# hit a serialization failure or deadlock) up to this many times, backing off
+# exponentially from DB_WRITE_RETRY_DELAY seconds (see consumables.retry).
+DB_WRITE_RETRIES = 0 if DATABASE_ENGINE != 'postgresql' and SQLITE_PROFILE == 'basic' else 3
+DB_WRITE_RETRY_DELAY = 0.05
+DB_WRITE_RETRY_MAX_DELAY = 1.0
+
+# Cache for the template fragments, sessions and logged-in users. CACHE_BACKEND is
+# 'locmem' (per process), 'file' (shared by every worker on the host) or 'redis'
+# (any Redis-compatible server, e.g. a local Valkey or KeyDB; needs redis-py).
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'formula-stock'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', BASE_DIR / 'cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/0'),
+}
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': config('CACHE_LOCATION', default=CACHE_BACKENDS[CACHE_BACKEND][1]),
     }
 }
 
+# Sessions are read from the cache and written through to the database, so a
+# cache miss (or a restarted locmem worker) only costs a lookup, never a logout.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Logged-in users are cached by id too (consumables.auth); ModelBackend stays
+# listed so sessions created before the cached backend keep working.
+AUTHENTICATION_BACKENDS = [
+    'consumables.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+USER_CACHE_SECONDS = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -118,6 +217,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# Serve STATIC_ROOT from Django (consumables.middleware.StaticFilesMiddleware) when
+# no web server does it; settings_production turns it on
+SERVE_STATIC = False
+STATIC_MAX_AGE = 60 * 60 * 24 * 365  # Hashed file names, so they can be cached for good
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -127,3 +230,26 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'
+
+# Request profiling: Server-Timing headers plus a grouped SQL log for slow requests
+REQUEST_PROFILING = False
+SLOW_REQUEST_QUERIES = 50
+SLOW_REQUEST_MS = 500
+
+# Metrics (/metrics). Set METRICS_DIR to a shared directory when running several
+# worker processes so the exporter can sum their counters.
+METRICS_DIR = None
+METRICS_FLUSH_SECONDS = 5
+# Admins can read /metrics when logged in; Prometheus sends this as a bearer
+# token (authorization: {credentials: ...} in the scrape config). Empty: admins only.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Live stock push (/stock/events/, served by asgi.py). Set LIVE_STOCK_DIR to a
+# local directory when running several worker processes so stock changes made
+# in one reach kiosks connected to another.
+LIVE_STOCK_DIR = None
+LIVE_STOCK_HEARTBEAT_SECONDS = 20
+
+# Consumption records older than this are rolled up into daily totals and
+# deleted by the compact_consumption command (see consumables.archive).
+CONSUMPTION_RETENTION_DAYS = 90
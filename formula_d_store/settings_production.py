@@ -0,0 +1,46 @@
+"""
+Production settings for formula_d_store.
+
+Everything in settings.py, plus what a live deployment needs: DEBUG off, the
+secret key and allowed hosts from the environment (or .env), cached template
+loaders, and content-hashed, precompressed static files. Select it with
+DJANGO_SETTINGS_MODULE=formula_d_store.settings_production, then run
+collectstatic so the hashed files and their .gz/.br copies exist.
+"""
+from decouple import Csv, config
+
+from .settings import *  # noqa: F401,F403
+from .settings import MIDDLEWARE, TEMPLATES
+
+DEBUG = False
+
+SECRET_KEY = config('SECRET_KEY')
+
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', cast=Csv())
+
+# Compile each template once per process instead of on every render
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
+
+# {% static %} links to css/style.<hash>.css and collectstatic writes .gz/.br copies
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'consumables.storage.PrecompressedManifestStaticFilesStorage'},
+}
+
+# Turn off when the web server maps /static/ to STATIC_ROOT itself
+SERVE_STATIC = config('DJANGO_SERVE_STATIC', default=True, cast=bool)
+
+# Static hits are answered before sessions, auth and metrics
+MIDDLEWARE = ['consumables.middleware.StaticFilesMiddleware', *MIDDLEWARE]